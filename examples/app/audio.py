@@ -0,0 +1,185 @@
+"""Live PCM from a pulse source for local consumers.
+
+The frames are read with parec while the meeting runs and handed out
+through an async iterator or a unix socket. A socket client first gets a
+json line describing the format, then every frame as an 8 bytes little
+endian sequence number followed by its samples, gaps in the sequence are
+frames the client was too slow for.
+"""
+import asyncio
+import collections
+import contextlib
+import json
+import logging
+import struct
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator
+
+_LOGGER = logging.getLogger(__name__)
+
+_FRAME_HEADER = struct.Struct("<Q")
+# Signed 16 bit samples
+_SAMPLE_BYTES = 2
+
+
+@dataclass(frozen=True)
+class PcmFrame:
+    seq: int
+    # time.monotonic() once the frame was read
+    timestamp: float
+    data: bytes
+
+
+class _Subscriber:
+    def __init__(self, capacity: int):
+        self.frames: collections.deque[PcmFrame] = collections.deque(maxlen=capacity)
+        self.ready = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, frame: PcmFrame) -> None:
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+        self.ready.set()
+
+
+class PcmTap:
+    """Reads fixed-size s16le frames from a pulse source.
+
+    Every consumer has a ring buffer of `capacity` frames. A consumer which
+    falls behind loses its oldest frames, they are counted as dropped, and
+    the capture never waits for a consumer, so the latency stays bounded.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        rate: int = 16000,
+        channels: int = 1,
+        frame_ms: int = 20,
+        capacity: int = 50,
+    ):
+        self.rate = rate
+        self.channels = channels
+        self.frame_bytes = rate * channels * _SAMPLE_BYTES * frame_ms // 1000
+        self.capacity = capacity
+        self._cmd = [
+            "parec",
+            f"--device={source}",
+            "--format=s16le",
+            f"--rate={rate}",
+            f"--channels={channels}",
+            "--raw",
+            f"--latency-msec={frame_ms}",
+        ]
+        self.frames_read = 0
+        self._subscribers: set[_Subscriber] = set()
+        # Drops of the consumers which are gone
+        self._dropped = 0
+        self._closed = False
+        self._proc = None
+        self._reader = None
+        self._servers: list[asyncio.AbstractServer] = []
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped + sum(s.dropped for s in self._subscribers)
+
+    def stats(self) -> dict:
+        return {
+            "frames_read": self.frames_read,
+            "dropped": self.dropped,
+            "consumers": len(self._subscribers),
+        }
+
+    async def __aenter__(self):
+        self._proc = await asyncio.create_subprocess_exec(
+            *self._cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        _LOGGER.info(f"parec started at {self._proc.pid}")
+        self._reader = asyncio.create_task(self._read())
+        return self
+
+    async def _read(self) -> None:
+        assert self._proc is not None and self._proc.stdout is not None
+        try:
+            while True:
+                data = await self._proc.stdout.readexactly(self.frame_bytes)
+                frame = PcmFrame(self.frames_read, time.monotonic(), data)
+                self.frames_read += 1
+                for subscriber in self._subscribers:
+                    subscriber.push(frame)
+        except asyncio.IncompleteReadError:
+            returncode = await self._proc.wait()
+            _LOGGER.error({"message": "parec exited", "returncode": returncode})
+        finally:
+            self._closed = True
+            for subscriber in self._subscribers:
+                subscriber.ready.set()
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        for server in self._servers:
+            server.close()
+        assert self._proc is not None and self._reader is not None
+        if self._proc.returncode is None:
+            self._proc.terminate()
+        await self._proc.wait()
+        self._reader.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._reader
+        _LOGGER.info({"message": "PCM tap is closed", **self.stats()})
+
+    async def frames(self) -> AsyncIterator[PcmFrame]:
+        """Yields the frames read from now on until the tap is closed."""
+        subscriber = _Subscriber(self.capacity)
+        self._subscribers.add(subscriber)
+        try:
+            while True:
+                while subscriber.frames:
+                    yield subscriber.frames.popleft()
+                if self._closed:
+                    return
+                subscriber.ready.clear()
+                await subscriber.ready.wait()
+        finally:
+            self._subscribers.discard(subscriber)
+            self._dropped += subscriber.dropped
+
+    async def _stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        header = {
+            "format": "s16le",
+            "rate": self.rate,
+            "channels": self.channels,
+            "frame_bytes": self.frame_bytes,
+        }
+        frames = self.frames()
+        try:
+            writer.write(json.dumps(header).encode("utf8") + b"\n")
+            async for frame in frames:
+                writer.write(_FRAME_HEADER.pack(frame.seq) + frame.data)
+                # A slow client waits here while its ring buffer drops frames
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            await frames.aclose()
+            writer.close()
+
+    async def serve(self, path: Path) -> asyncio.AbstractServer:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.unlink(missing_ok=True)
+        server = await asyncio.start_unix_server(self._stream, path=str(path))
+        self._servers.append(server)
+        _LOGGER.info({"message": "Serving PCM", "socket": str(path)})
+        return server
+
+
+@contextlib.asynccontextmanager
+async def serve_pcm(source: str, path: Path) -> AsyncIterator[PcmTap]:
+    async with PcmTap(source) as tap:
+        await tap.serve(path)
+        yield tap
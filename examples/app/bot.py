@@ -0,0 +1,50 @@
+import asyncio
+import contextlib
+import logging
+import shutil
+from pathlib import Path
+
+from examples.app.zoom_app import ZoomApp
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _save_logs(zoom: ZoomApp, logs_dir: Path) -> None:
+    shutil.copytree(zoom.home / ".zoom", logs_dir)
+    if zoom.output is not None:
+        (logs_dir / "output.log").write_bytes(zoom.output.tail())
+
+
+async def attend(
+    zoom: ZoomApp,
+    url: str,
+    logs_dir: Path = Path("/home/nonroot/tmp/zoom"),
+    duration: int = 180,
+) -> None:
+    """Joins the meeting, greets it and stays for `duration` seconds.
+
+    Zoom logs and the last output of zoom are copied to `logs_dir` when the
+    bot fails in the meeting.
+    """
+    try:
+        _ = await zoom.join(url)
+    except RuntimeError as e:
+        _save_logs(zoom, logs_dir)
+        _LOGGER.info(f"Leaving... {repr(e)}")
+        return
+
+    post_join = asyncio.create_task(zoom.post_join())
+    try:
+        await zoom.send_welcome_message("Hello, world!")
+        n = duration
+        while n > 0:
+            await asyncio.sleep(1)
+            n -= 1
+            _LOGGER.info(f"Waiting... {n}")
+    except Exception as e:
+        _save_logs(zoom, logs_dir)
+        _LOGGER.info(f"Leaving... {repr(e)}")
+    finally:
+        post_join.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await post_join
@@ -0,0 +1,83 @@
+import asyncio
+import heapq
+import itertools
+from dataclasses import dataclass, field
+
+
+@dataclass(order=True)
+class Outgoing:
+    # Negated priority, the heap pops the smallest
+    rank: int
+    seq: int
+    message: str = field(compare=False)
+    # loop.time() after which the message is not worth sending anymore
+    deadline: float | None = field(compare=False)
+    sent: asyncio.Future = field(compare=False)
+    # Fails the message at the deadline while it's waiting
+    timer: asyncio.TimerHandle | None = field(default=None, compare=False)
+
+
+class Outbox:
+    """Messages waiting to be posted, the highest priority first.
+
+    Messages of the same priority keep their order. A message which is
+    still waiting at its deadline is dropped and fails with RuntimeError,
+    one which is being posted is not interrupted.
+    """
+
+    def __init__(self):
+        self._heap: list[Outgoing] = []
+        self._seq = itertools.count()
+        self._pending = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def put(self, message: str, priority: int = 0, timeout: float | None = None) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        item = Outgoing(
+            -priority,
+            next(self._seq),
+            message,
+            loop.time() + timeout if timeout is not None else None,
+            loop.create_future(),
+        )
+        if item.deadline is not None:
+            item.timer = loop.call_at(item.deadline, self._expire, item)
+        heapq.heappush(self._heap, item)
+        self._pending.set()
+        return item.sent
+
+    def _expire(self, item: Outgoing) -> None:
+        try:
+            self._heap.remove(item)
+        except ValueError:
+            return
+        heapq.heapify(self._heap)
+        if not item.sent.done():
+            item.sent.set_exception(RuntimeError(f"Message not sent in time: {item.message!r}"))
+
+    async def wait(self) -> None:
+        """Waits until there is a message to post."""
+        while not self._heap:
+            self._pending.clear()
+            await self._pending.wait()
+
+    def pop(self) -> Outgoing | None:
+        """The next message to post, the cancelled ones are dropped."""
+        while self._heap:
+            item = heapq.heappop(self._heap)
+            if item.timer is not None:
+                item.timer.cancel()
+            if item.sent.done():
+                continue
+            return item
+        return None
+
+    def fail(self, error: BaseException) -> None:
+        while self._heap:
+            item = heapq.heappop(self._heap)
+            if item.timer is not None:
+                item.timer.cancel()
+            if not item.sent.done():
+                item.sent.set_exception(error)
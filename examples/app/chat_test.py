@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+
+from examples.app.chat import Outbox
+
+
+class OutboxTest(unittest.IsolatedAsyncioTestCase):
+    async def test_higher_priority_first_then_in_order(self):
+        outbox = Outbox()
+        outbox.put("first")
+        outbox.put("urgent", priority=1)
+        outbox.put("second")
+        messages = []
+        while (item := outbox.pop()) is not None:
+            messages.append(item.message)
+        self.assertEqual(messages, ["urgent", "first", "second"])
+
+    async def test_waiting_message_fails_at_its_deadline(self):
+        outbox = Outbox()
+        late = outbox.put("late", timeout=0.01)
+        outbox.put("patient")
+        with self.assertRaises(RuntimeError):
+            await late
+        self.assertEqual(len(outbox), 1)
+        self.assertEqual(outbox.pop().message, "patient")
+
+    async def test_popped_message_is_not_expired(self):
+        outbox = Outbox()
+        sent = outbox.put("posting", timeout=0.01)
+        item = outbox.pop()
+        await asyncio.sleep(0.02)
+        self.assertFalse(sent.done())
+        item.sent.set_result(None)
+
+    async def test_cancelled_message_is_dropped(self):
+        outbox = Outbox()
+        outbox.put("cancelled").cancel()
+        outbox.put("kept")
+        self.assertEqual(outbox.pop().message, "kept")
+        self.assertIsNone(outbox.pop())
+
+    async def test_fail_resolves_every_waiting_message(self):
+        outbox = Outbox()
+        sent = [outbox.put("a", timeout=10), outbox.put("b")]
+        outbox.fail(RuntimeError("exited"))
+        self.assertEqual(len(outbox), 0)
+        for future in sent:
+            with self.assertRaisesRegex(RuntimeError, "exited"):
+                await future
+
+    async def test_wait_returns_once_a_message_is_queued(self):
+        outbox = Outbox()
+        waiting = asyncio.create_task(outbox.wait())
+        await asyncio.sleep(0)
+        self.assertFalse(waiting.done())
+        outbox.put("hello")
+        await asyncio.wait_for(waiting, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,214 @@
+"""Keeps reading the output of the child processes.
+
+A child blocks once nobody reads the pipe it writes to and the pipe
+buffer is full, so every piped stdout and stderr is read as it comes.
+The last bytes are kept for crash reports and the lines are logged at a
+limited rate.
+
+The pipes of subprocess.Popen children are read by one thread for all
+of them, the ones of asyncio children by a task per stream.
+"""
+import asyncio
+import logging
+import os
+import selectors
+import subprocess
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bytes of the output kept per process
+TAIL_BYTES = 64 * 1024
+_CHUNK = 4096
+# Longer lines are logged in pieces
+_MAX_LINE = 4096
+
+
+class ProcessOutput:
+    """The last `capacity` bytes a process wrote and a rate-limited log of it."""
+
+    def __init__(
+        self,
+        name: str,
+        capacity: int = TAIL_BYTES,
+        lines_per_second: float = 5.0,
+        burst: int = 20,
+    ):
+        self.name = name
+        self.capacity = capacity
+        self._rate = lines_per_second
+        self._burst = burst
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self.suppressed = 0
+        self._tail = bytearray()
+        self._partial: dict[str, bytes] = {}
+        self._open: set[str] = set()
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+        self._tasks: set[asyncio.Task] = set()
+
+    def open(self, stream: str) -> None:
+        with self._lock:
+            self._open.add(stream)
+            self._closed.clear()
+
+    def feed(self, stream: str, data: bytes) -> None:
+        with self._lock:
+            self._tail += data
+            if len(self._tail) > self.capacity:
+                del self._tail[: len(self._tail) - self.capacity]
+            lines = (self._partial.pop(stream, b"") + data).split(b"\n")
+            partial = lines.pop()
+            if len(partial) > _MAX_LINE:
+                lines.append(partial)
+            else:
+                self._partial[stream] = partial
+        for line in lines:
+            self._log(stream, line)
+
+    def close(self, stream: str) -> None:
+        with self._lock:
+            partial = self._partial.pop(stream, b"")
+            self._open.discard(stream)
+            if not self._open:
+                self._closed.set()
+        if partial:
+            self._log(stream, partial)
+
+    def _allowed(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._refilled) * self._rate)
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _log(self, stream: str, line: bytes) -> None:
+        if not line.strip():
+            return
+        if not self._allowed():
+            self.suppressed += 1
+            return
+        record = {
+            "process": self.name,
+            "stream": stream,
+            "line": line.decode("utf8", "replace").rstrip(),
+        }
+        if self.suppressed:
+            record["suppressed"] = self.suppressed
+            self.suppressed = 0
+        _LOGGER.info(record)
+
+    def tail(self) -> bytes:
+        with self._lock:
+            return bytes(self._tail)
+
+    def text(self) -> str:
+        return self.tail().decode("utf8", "replace")
+
+    def wait_closed(self, timeout: float | None = None) -> bool:
+        """Waits for the pipes to be read to the end, which follows the exit."""
+        return self._closed.wait(timeout)
+
+
+class _Drainer:
+    """Reads the registered pipes with one selector thread."""
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="pipe-drain", daemon=True)
+        self._thread.start()
+
+    def add(self, pipe, output: ProcessOutput, stream: str) -> None:
+        os.set_blocking(pipe.fileno(), False)
+        output.open(stream)
+        with self._lock:
+            self._pending.append((pipe, output, stream))
+        os.write(self._wakeup_w, b"\0")
+
+    def _register_pending(self) -> None:
+        while True:
+            try:
+                if not os.read(self._wakeup_r, _CHUNK):
+                    break
+            except BlockingIOError:
+                break
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for pipe, output, stream in pending:
+            self._selector.register(pipe, selectors.EVENT_READ, (output, stream))
+
+    def _run(self) -> None:
+        while True:
+            for key, _ in self._selector.select():
+                if key.data is None:
+                    self._register_pending()
+                    continue
+                output, stream = key.data
+                try:
+                    data = os.read(key.fd, _CHUNK)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b""
+                if data:
+                    output.feed(stream, data)
+                    continue
+                self._selector.unregister(key.fileobj)
+                key.fileobj.close()
+                output.close(stream)
+
+
+_drainer: _Drainer | None = None
+_drainer_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # The thread of the parent doesn't exist in the child
+    global _drainer, _drainer_lock
+    _drainer = None
+    _drainer_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def drain(name: str, proc: subprocess.Popen, **kwargs) -> ProcessOutput:
+    """Reads the piped stdout and stderr of `proc` until they are closed."""
+    global _drainer
+    with _drainer_lock:
+        if _drainer is None:
+            _drainer = _Drainer()
+    output = ProcessOutput(name, **kwargs)
+    for stream, pipe in (("stdout", proc.stdout), ("stderr", proc.stderr)):
+        if pipe is not None:
+            _drainer.add(pipe, output, stream)
+    return output
+
+
+async def _read(output: ProcessOutput, stream: str, reader: asyncio.StreamReader) -> None:
+    try:
+        while data := await reader.read(_CHUNK):
+            output.feed(stream, data)
+    finally:
+        output.close(stream)
+
+
+def drain_async(name: str, proc: asyncio.subprocess.Process, **kwargs) -> ProcessOutput:
+    """Like `drain` for a child started with asyncio."""
+    output = ProcessOutput(name, **kwargs)
+    for stream, reader in (("stdout", proc.stdout), ("stderr", proc.stderr)):
+        if reader is not None:
+            output.open(stream)
+            task = asyncio.create_task(_read(output, stream, reader))
+            output._tasks.add(task)
+            task.add_done_callback(output._tasks.discard)
+    return output
@@ -1,3 +1,4 @@
+import base64
 import logging
 import os
 import hashlib
@@ -5,17 +6,73 @@ import shlex
 import socket
 import subprocess
 import time
+from dataclasses import dataclass
 from pathlib import Path
 
+from examples.app.drain import ProcessOutput, drain
+
 _LOGGER = logging.getLogger(__name__)
 
+# How long a service may take to become ready
+READY_TIMEOUT = 10
+# How often the readiness probes are polled
+_PROBE_INTERVAL = 0.05
+
+
+def _wait_ready(
+    name: str,
+    cmd: list[str],
+    proc: subprocess.Popen,
+    output: ProcessOutput,
+    probe,
+    timeout: float = READY_TIMEOUT,
+    daemonizes: bool = False,
+) -> None:
+    """Polls the probe until the service is ready or its process has failed.
+
+    Services started with `daemonizes` fork into the background, so their
+    process exiting successfully is expected.
+    """
+    deadline = time.monotonic() + timeout
+    while not probe():
+        ret_code = proc.poll()
+        if ret_code is not None and not (daemonizes and ret_code == 0):
+            _failed(name, cmd, ret_code, output)
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{name} is not ready after {timeout}s: {shlex.join(cmd)}")
+        time.sleep(_PROBE_INTERVAL)
+
+
+def _failed(name: str, cmd: list[str], ret_code: int, output: ProcessOutput):
+    # Whatever is still in the pipes comes right after the exit
+    output.wait_closed(timeout=1)
+    raise RuntimeError(f"{name} did not start ({ret_code}): {shlex.join(cmd)}\n{output.text()}")
+
+
+def _accepts_connections(path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX) as s:
+        try:
+            s.connect(str(path))
+        except OSError:
+            return False
+    return True
 
-class Xvfb:
-    SLEEP_TIME_BEFORE_START = 0.1
 
+class Xvfb:
     def __init__(
-        self, width: int = 1280, height: int = 720, depth: int = 24, display: str = ":0"
+        self,
+        width: int = 1280,
+        height: int = 720,
+        depth: int = 24,
+        display: str = ":0",
+        dpi: int = 96,
+        authority: str = "~/.Xauthority",
     ):
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        # ":1.0" listens on /tmp/.X11-unix/X1
+        self.socket = Path(f"/tmp/.X11-unix/X{display.lstrip(':').split('.')[0]}")
         self._cmd = [
             "Xvfb",
             display,
@@ -24,9 +81,9 @@ class Xvfb:
             f"{width}x{height}x{depth}",
             "-ac",
             "-auth",
-            "~/.Xauthority",
+            authority,
             "-dpi",
-            "96",
+            str(dpi),
             "-f",
             "0",
             "-nolisten",
@@ -34,10 +91,14 @@ class Xvfb:
             "+extension",
             "RANDR",
             "+extension",
-            "GLX"
+            "GLX",
+            # Screen capture for the template matching goes through XShm
+            "+extension",
+            "MIT-SHM",
         ]
 
         self.proc = None
+        self.output = None
 
 
     def __enter__(self):
@@ -45,32 +106,41 @@ class Xvfb:
         self.proc = subprocess.Popen(
             self._cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
+        # Nobody else reads the pipes, a full one would block the service
+        self.output = drain("Xvfb", self.proc)
 
         _LOGGER.info(
             f"Xvfb started at {self.proc.pid} (returncode = {self.proc.returncode})"
         )
-        # give Xvfb time to start
-        time.sleep(self.__class__.SLEEP_TIME_BEFORE_START)
-        ret_code = self.proc.poll()
-        if ret_code is not None:
-            _, err = self.proc.communicate()
-            raise RuntimeError(
-                f"Xvfb did not start ({ret_code}): {shlex.join(self._cmd)}\n{err.decode('utf8')}"
-            )
+        _wait_ready("Xvfb", self._cmd, self.proc, self.output, self.ready)
         return self
 
+    def ready(self) -> bool:
+        return _accepts_connections(self.socket)
+
     def __exit__(self, exc_type, exc_value, exc_tb):
         assert self.proc is not None
-        if self.proc.returncode is not None:
+        if self.proc.poll() is None:
             self.proc.terminate()
 
 
 class XAuth:
     def __init__(
-        self, display: str = ":0"
+        self, display: str = ":0", authority: Path = Path("/home/nonroot/.Xauthority")
     ):
-        self._cmd = ["xauth", "add", display, ".", self.generate_mcookie()]
+        # xauth rewrites the whole file, concurrent bots need files of their own
+        self.authority = authority
+        self._cmd = [
+            "xauth",
+            "-f",
+            str(authority),
+            "add",
+            display,
+            ".",
+            self.generate_mcookie(),
+        ]
         self.proc = None
+        self.output = None
 
     @staticmethod
     def generate_mcookie():
@@ -81,29 +151,28 @@ class XAuth:
         return hashlib.md5(data).hexdigest()
 
     def __enter__(self):
-        Path("/home/nonroot/.Xauthority").touch()
+        self.authority.touch()
 
         self.proc = subprocess.Popen(
             self._cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
         )
+        self.output = drain("XAuth", self.proc)
         _LOGGER.info(
             f"XAuth started at {self.proc.pid} (returncode = {self.proc.returncode})"
         )
-
-        ret_code = self.proc.poll()
-        if ret_code is not None:
-            _, err = self.proc.communicate()
-            raise RuntimeError(
-                f"Xauth did not start ({ret_code}): {shlex.join(self._cmd)}\n{err.decode('utf8')}"
-            )
+        # xauth is done once the cookie is written
+        _wait_ready("Xauth", self._cmd, self.proc, self.output, self.ready, daemonizes=True)
 
         return self
 
+    def ready(self) -> bool:
+        return self.proc is not None and self.proc.poll() == 0
+
     def __exit__(self, exc_type, exc_value, exc_tb):
         assert self.proc is not None
-        if self.proc.returncode is not None:
+        if self.proc.poll() is None:
             self.proc.terminate()
 
 
@@ -113,11 +182,13 @@ class Fluxbox:
         self._cmd = ["fluxbox", "-screen", "0", "-display", display]
 
         self.proc = None
+        self.output = None
 
     def __enter__(self):
         self.proc = subprocess.Popen(
             self._cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
+        self.output = drain("Fluxbox", self.proc)
 
         _LOGGER.info(
             f"Fluxbox started at {self.proc.pid} (returncode = {self.proc.returncode})"
@@ -125,10 +196,7 @@ class Fluxbox:
 
         ret_code = self.proc.poll()
         if ret_code is not None:
-            _, err = self.proc.communicate()
-            raise RuntimeError(
-                f"Fluxbox did not start ({ret_code}): {shlex.join(self._cmd)}\n{err.decode('utf8')}"
-            )
+            _failed("Fluxbox", self._cmd, ret_code, self.output)
 
         Path("/home/nonroot/.fluxbox").mkdir(exist_ok=True)
         Path("/home/nonroot/.fluxbox/keys").write_text(
@@ -139,13 +207,11 @@ class Fluxbox:
 
     def __exit__(self, exc_type, exc_value, exc_tb):
         assert self.proc is not None
-        if self.proc.returncode is not None:
+        if self.proc.poll() is None:
             self.proc.terminate()
 
 
 class DBus:
-    SLEEP_TIME_BEFORE_START = 0.5
-
     def __init__(self, bus_address: str):
         self._cmd = [
             "dbus-daemon",
@@ -163,6 +229,7 @@ class DBus:
             f"{self.dbus_session_address.parent} expected to be exist"
         )
         self.proc = None
+        self.output = None
 
     def __enter__(self):
         s = socket.socket(socket.AF_UNIX)
@@ -171,23 +238,41 @@ class DBus:
         self.proc = subprocess.Popen(
             self._cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
+        self.output = drain("DBus", self.proc)
 
         _LOGGER.info(
             f"DBus started at {self.proc.pid} (returncode = {self.proc.returncode})"
         )
+        # dbus-daemon forks, the bus is ready once its socket answers
+        _wait_ready("DBus", self._cmd, self.proc, self.output, self.ready, daemonizes=True)
 
         return self
 
+    def ready(self) -> bool:
+        return _accepts_connections(self.dbus_session_address)
+
     def __exit__(self, exc_type, exc_value, exc_tb):
         assert self.proc is not None
-        if self.proc.returncode is not None:
+        if self.proc.poll() is None:
             self.proc.terminate()
 
 
+_PULSE_COOKIE = (
+    "gIvST5iz2S0J1+JlXC1lD3HWvg61vDTV1xbmiGxZnjB6E3psXsjWUVQS4SRrch6rygQgtpw7qmgh"
+    "DFTaekt8qWiCjGvB0LNzQbvhfs1SFYDMakmIXuoqYoWFqTJ+GOXYByxpgCMylMKwpOoANEDePUCj"
+    "36nwGaJNTNSjL8WBv+Bf3rJXqWnJ/43a0hUhmBBt28Dhiz6Yqowa83Y4iDRNJbxih6rB1vRNDKqR"
+    "r/J9XJV+dOlM0dI+K6Vf5Ag+2LGZ3rc5sPVqgHgKK0mcNcsn+yCmO+XLQHD1K+QgL8RITs7nNeF1"
+    "ikYPVgEYnc0CGzHTMvFR7JLgwL2gTXulCdwPbg=="
+)
+
+
 class Pulseaudio:
-    SLEEP_TIME_BEFORE_START = 0.5
+    SINK = "SpeakerOutput"
+    SOURCE = "SpeakerOutput.monitor"
 
     def __init__(self):
+        self.config_dir = Path.home() / ".config/pulse"
+        self.script = self.config_dir / "callbot.pa"
         self._cmd = [
             "pulseaudio",
             "--start",
@@ -195,89 +280,348 @@ class Pulseaudio:
             "--disallow-exit",
             "--log-level=4",
             "--log-target=newfile:/home/nonroot/tmp/pulseaudio.log",
+            # The whole configuration is applied by the daemon from one script
+            "-n",
+            f"--file={self.script}",
         ]
 
         self.proc = None
-
-    def run_cmd(self, cmd: str):
-        try:
-            _ = subprocess.check_output(cmd, shell=True)
-        except subprocess.CalledProcessError as e:
-            _LOGGER.error(
-                {
-                    "message": "Failed to execute the command",
-                    "cmd": cmd,
-                    "error": repr(e),
-                }
-            )
-            raise RuntimeError("Failed to prepare env")
+        self.output = None
+
+    def startup_script(self) -> str:
+        return "\n".join(
+            [
+                ".include /etc/pulse/default.pa",
+                ".nofail",
+                "unload-module module-suspend-on-idle",
+                ".fail",
+                "load-module module-native-protocol-tcp",
+                # Create a virtual speaker output
+                f"load-module module-null-sink sink_name={self.SINK} "
+                'sink_properties=device.description="Dummy_Output"',
+                # Create a virtual microphone
+                f"set-default-source {self.SOURCE}",
+                f"set-default-sink {self.SINK}",
+                # set volume, 65536 is 100%
+                f"set-sink-volume {self.SINK} 65536",
+                f"set-source-volume {self.SOURCE} 65536",
+                "",
+            ]
+        )
 
     def __enter__(self):
-        self.run_cmd("mkdir -p ~/.config/pulse")
-        self.run_cmd(
-            "echo -n 'gIvST5iz2S0J1+JlXC1lD3HWvg61vDTV1xbmiGxZnjB6E3psXsjWUVQS4SRrch6rygQgtpw7qmghDFTaekt8qWiCjGvB0LNzQbvhfs1SFYDMakmIXuoqYoWFqTJ+GOXYByxpgCMylMKwpOoANEDePUCj36nwGaJNTNSjL8WBv+Bf3rJXqWnJ/43a0hUhmBBt28Dhiz6Yqowa83Y4iDRNJbxih6rB1vRNDKqRr/J9XJV+dOlM0dI+K6Vf5Ag+2LGZ3rc5sPVqgHgKK0mcNcsn+yCmO+XLQHD1K+QgL8RITs7nNeF1ikYPVgEYnc0CGzHTMvFR7JLgwL2gTXulCdwPbg=='| base64 -d>~/.config/pulse/cookie"
-        )
+        self.config_dir.mkdir(parents=True, exist_ok=True)
+        (self.config_dir / "cookie").write_bytes(base64.b64decode(_PULSE_COOKIE))
+        self.script.write_text(self.startup_script())
 
         self.proc = subprocess.Popen(
             self._cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
+        self.output = drain("Pulseaudio", self.proc)
 
         _LOGGER.info(
             f"Pulseaudio started at {self.proc.pid} (returncode = {self.proc.returncode})"
         )
+        # pulseaudio --start daemonizes, the server is ready once pactl can talk to it
+        _wait_ready("Pulseaudio", self._cmd, self.proc, self.output, self.ready, daemonizes=True)
+        self.verify()
+        return self
 
-        time.sleep(self.__class__.SLEEP_TIME_BEFORE_START)
-        ret_code = self.proc.poll()
-        if ret_code is not None and ret_code != 0:
-            _, err = self.proc.communicate()
-            raise RuntimeError(
-                f"Pulseaudio did not start ({ret_code}): {shlex.join(self._cmd)}\n{err.decode('utf8')}"
+    @staticmethod
+    def info() -> dict[str, str] | None:
+        proc = subprocess.run(
+            ["pactl", "info"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        if proc.returncode != 0:
+            return None
+        info = {}
+        for line in proc.stdout.decode("utf8").splitlines():
+            key, _, value = line.partition(":")
+            info[key.strip()] = value.strip()
+        return info
+
+    def ready(self) -> bool:
+        return self.info() is not None
+
+    def verify(self) -> None:
+        info = self.info() or {}
+        expected = {"Default Sink": self.SINK, "Default Source": self.SOURCE}
+        actual = {key: info.get(key) for key in expected}
+        if actual != expected:
+            _LOGGER.error(
+                {
+                    "message": "Pulseaudio is configured unexpectedly",
+                    "expected": expected,
+                    "actual": actual,
+                    "script": str(self.script),
+                }
             )
-        settings = [
-            "pactl unload-module module-suspend-on-idle",
-            "pactl load-module module-native-protocol-tcp",
-            # Create a virtual speaker output
-            'pactl load-module module-null-sink sink_name=SpeakerOutput sink_properties=device.description="Dummy_Output"',
-            # Create a virtual microphone
-            "pactl set-default-source SpeakerOutput.monitor",
-            "pactl set-default-sink SpeakerOutput",
-            # set volume
-            "pactl set-sink-volume SpeakerOutput 100%",
-            "pactl set-source-volume SpeakerOutput.monitor 100%",
-        ]
-        for cmd in settings:
-            self.run_cmd(cmd)
-        return self
+            raise RuntimeError("Failed to prepare env")
 
     def __exit__(self, exc_type, exc_value, exc_tb):
         assert self.proc is not None
-        if self.proc.returncode is not None:
+        if self.proc.poll() is None:
             self.proc.terminate()
 
 
+class PulseSink:
+    """A null sink of its own for one bot, its monitor is the bot's source.
+
+    The bots share the Pulseaudio daemon but each of them plays to and
+    records from its own sink.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.monitor = f"{name}.monitor"
+        self._module = None
+
+    def __enter__(self):
+        cmd = [
+            "pactl",
+            "load-module",
+            "module-null-sink",
+            f"sink_name={self.name}",
+            f"sink_properties=device.description={self.name}",
+        ]
+        try:
+            self._module = subprocess.check_output(cmd).decode("utf8").strip()
+        except subprocess.CalledProcessError as e:
+            _LOGGER.error(
+                {
+                    "message": "Failed to execute the command",
+                    "cmd": shlex.join(cmd),
+                    "error": repr(e),
+                }
+            )
+            raise RuntimeError("Failed to prepare env")
+        _LOGGER.info(f"Sink {self.name} loaded as module {self._module}")
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        assert self._module is not None
+        subprocess.run(["pactl", "unload-module", self._module])
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    """How FFmpeg encodes and lays out a recording.
+
+    `container` is one of
+      "mp4": a single fragmented mp4, readable while it's written and
+        valid up to the last fragment if ffmpeg dies,
+      "hls": an HLS playlist of mp4 segments,
+      "segments": standalone mp4 files of `segment_seconds` each.
+    Either `crf` or `video_bitrate` is used, the bitrate wins if both are set.
+
+    Profiles without `video` record only the pulse source, nothing is
+    grabbed from the display and the file type follows the audio codec.
+
+    `adaptive` profiles drop the frames which don't differ from the last
+    kept one and write a variable frame rate, a static screen costs one
+    frame per `max_static_seconds` and the full rate is back with the
+    first changed frame.
+    """
+
+    fps: int = 25
+    preset: str = "veryfast"
+    crf: int | None = 23
+    video_bitrate: str | None = None
+    # Encoder threads, 0 lets x264 pick by the cores count
+    threads: int = 2
+    gop_seconds: float = 2.0
+    audio_codec: str = "aac"
+    audio_bitrate: str = "128k"
+    container: str = "mp4"
+    segment_seconds: int = 10
+    tune: str | None = None
+    video: bool = True
+    audio_sample_rate: int = 48000
+    adaptive: bool = False
+    max_static_seconds: float = 2.0
+
+    def __post_init__(self):
+        if self.container not in _CONTAINERS:
+            raise ValueError(f"Unknown container {self.container}")
+        if not self.video and self.container == "hls":
+            raise ValueError("HLS needs video")
+        if not self.video and self.audio_codec not in _AUDIO_SUFFIXES:
+            raise ValueError(f"No audio-only file type for {self.audio_codec}")
+
+    def output_path(self, output: Path) -> Path:
+        if not self.video:
+            output = output.with_suffix(_AUDIO_SUFFIXES[self.audio_codec])
+        if self.container == "hls":
+            return output.with_suffix(".m3u8")
+        if self.container == "segments":
+            return output.with_name(f"{output.stem}_%05d{output.suffix}")
+        return output
+
+    def encoding_args(self) -> list[str]:
+        if not self.video:
+            args = ["-vn", "-c:a", self.audio_codec, "-ar", str(self.audio_sample_rate)]
+            # Lossless codecs have no bitrate to set
+            if self.audio_codec == "libopus":
+                args += ["-b:a", self.audio_bitrate]
+            return args
+
+        gop = max(1, round(self.fps * self.gop_seconds))
+        args = ["-c:v", "libx264", "-preset", self.preset, "-pix_fmt", "yuv420p"]
+        if self.tune is not None:
+            args += ["-tune", self.tune]
+        if self.video_bitrate is not None:
+            args += ["-b:v", self.video_bitrate, "-maxrate", self.video_bitrate]
+            args += ["-bufsize", self.video_bitrate]
+        elif self.crf is not None:
+            args += ["-crf", str(self.crf)]
+        if self.adaptive:
+            # The frames are counted after the dropping, keyframes go by time
+            max_dropped = max(1, round(self.fps * self.max_static_seconds))
+            args += ["-vf", f"mpdecimate=max={max_dropped}", "-fps_mode", "vfr"]
+            args += ["-force_key_frames", f"expr:gte(t,n_forced*{self.gop_seconds})"]
+        else:
+            # Fixed keyframes so fragments and segments are cut at the same pace
+            args += ["-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0"]
+        args += ["-threads", str(self.threads)]
+        args += ["-c:a", self.audio_codec, "-b:a", self.audio_bitrate]
+        return args
+
+    def container_args(self, output: Path) -> list[str]:
+        if self.container == "hls":
+            return [
+                "-f",
+                "hls",
+                "-hls_time",
+                str(self.segment_seconds),
+                "-hls_list_size",
+                "0",
+                "-hls_segment_type",
+                "fmp4",
+                "-hls_segment_filename",
+                str(output.with_name(f"{output.stem}_%05d.m4s")),
+            ]
+        if self.container == "segments":
+            return [
+                "-f",
+                "segment",
+                "-segment_time",
+                str(self.segment_seconds),
+                "-reset_timestamps",
+                "1",
+                *(["-segment_format_options", f"movflags={_FRAGMENTED}"] if self.video else []),
+            ]
+        return ["-movflags", _FRAGMENTED] if self.video else []
+
+
+_CONTAINERS = ("mp4", "hls", "segments")
+# Every keyframe starts a fragment which is playable on its own
+_FRAGMENTED = "+frag_keyframe+empty_moov+default_base_moof"
+_AUDIO_SUFFIXES = {"libopus": ".ogg", "flac": ".flac", "pcm_s16le": ".wav"}
+
+PROFILES = {
+    "standard": EncodingProfile(),
+    # Slides and faces of a meeting survive a low frame rate, it leaves
+    # the CPU to more bots
+    "economy": EncodingProfile(
+        fps=10, preset="ultrafast", crf=30, threads=1, gop_seconds=5, audio_bitrate="64k"
+    ),
+    "live": EncodingProfile(
+        fps=15,
+        preset="veryfast",
+        crf=None,
+        video_bitrate="1500k",
+        threads=1,
+        gop_seconds=2,
+        container="hls",
+        segment_seconds=4,
+        tune="zerolatency",
+    ),
+    "archive": EncodingProfile(
+        fps=25, preset="medium", crf=20, threads=0, container="segments", segment_seconds=300
+    ),
+    # Meetings are mostly static slides and faces
+    "adaptive": EncodingProfile(
+        fps=25, preset="veryfast", crf=26, threads=1, audio_bitrate="96k", adaptive=True
+    ),
+    # Audio only, for transcription
+    "opus": EncodingProfile(video=False, audio_codec="libopus", audio_bitrate="32k"),
+    "flac": EncodingProfile(video=False, audio_codec="flac", audio_sample_rate=16000),
+    "wav": EncodingProfile(video=False, audio_codec="pcm_s16le", audio_sample_rate=16000),
+}
+
+
+def encoding_profile(name: str) -> EncodingProfile:
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown encoding profile {name}, one of {', '.join(PROFILES)}")
+
+
+@dataclass(frozen=True)
+class Region:
+    """A rectangle of the screen, parsed from X geometry like 1280x600+0+60."""
+
+    width: int
+    height: int
+    left: int = 0
+    top: int = 0
+
+    @classmethod
+    def parse(cls, geometry: str) -> "Region":
+        size, _, offset = geometry.partition("+")
+        width, _, height = size.partition("x")
+        left, _, top = offset.partition("+")
+        try:
+            return cls(int(width), int(height), int(left or 0), int(top or 0))
+        except ValueError:
+            raise ValueError(f"Expected WxH+X+Y, got {geometry}")
+
+
 class FFmpeg:
-    def __init__(self, width: int = 1280, height: int = 720, display: str = ":0"):
-        self._cmd = [
-            "ffmpeg",
-            "-video_size",
-            f"{width}x{height}",
-            "-framerate",
-            "25",
-            "-f",
-            "x11grab",
-            "-i",
-            display,
+    def __init__(
+        self,
+        width: int = 1280,
+        height: int = 720,
+        display: str = ":0",
+        output: Path = Path("/home/nonroot/tmp/output.mp4"),
+        audio_source: str = "default",
+        profile: EncodingProfile = PROFILES["standard"],
+        region: Region | None = None,
+    ):
+        self.output = profile.output_path(output)
+        # Only the region is grabbed, the meeting view without the toolbars
+        # and panels around it
+        region = region or Region(width, height)
+        self._cmd = ["ffmpeg"]
+        if profile.video:
+            self._cmd += [
+                # yuv420p needs even sizes
+                "-video_size",
+                f"{region.width - region.width % 2}x{region.height - region.height % 2}",
+                "-framerate",
+                str(profile.fps),
+                # The cursor would make a static screen look changed
+                *(["-draw_mouse", "0"] if profile.adaptive else []),
+                "-f",
+                "x11grab",
+                "-i",
+                f"{display}+{region.left},{region.top}",
+            ]
+        self._cmd += [
             "-f",
             "pulse",
             "-ac",
             "2",
             "-i",
-            "default",
-            "/home/nonroot/tmp/output.mp4",
+            audio_source,
+            *profile.encoding_args(),
+            *profile.container_args(self.output),
+            str(self.output),
         ]
         self.proc = None
 
     def __enter__(self):
+        self.output.parent.mkdir(parents=True, exist_ok=True)
         self.proc = subprocess.Popen(self._cmd, stdin=subprocess.PIPE)
 
         return self
@@ -0,0 +1,70 @@
+import unittest
+from pathlib import Path
+
+from examples.app.env import PROFILES, EncodingProfile, Region, encoding_profile
+
+
+class RegionTest(unittest.TestCase):
+    def test_parses_size_and_offset(self):
+        self.assertEqual(Region.parse("1280x600+0+60"), Region(1280, 600, 0, 60))
+
+    def test_offset_defaults_to_the_corner(self):
+        self.assertEqual(Region.parse("800x600"), Region(800, 600, 0, 0))
+
+    def test_rejects_malformed_geometry(self):
+        for geometry in ("", "1280", "1280x", "axb", "1280x600+a+0"):
+            with self.subTest(geometry=geometry), self.assertRaises(ValueError):
+                Region.parse(geometry)
+
+
+class EncodingProfileTest(unittest.TestCase):
+    def _value(self, args: list[str], flag: str) -> str:
+        return args[args.index(flag) + 1]
+
+    def test_keyframes_follow_the_gop(self):
+        args = EncodingProfile(fps=10, gop_seconds=5).encoding_args()
+        self.assertEqual(self._value(args, "-g"), "50")
+        self.assertEqual(self._value(args, "-keyint_min"), "50")
+
+    def test_bitrate_wins_over_crf(self):
+        args = EncodingProfile(crf=20, video_bitrate="1500k").encoding_args()
+        self.assertNotIn("-crf", args)
+        self.assertEqual(self._value(args, "-maxrate"), "1500k")
+
+    def test_adaptive_drops_static_frames(self):
+        args = EncodingProfile(fps=25, adaptive=True, max_static_seconds=2).encoding_args()
+        self.assertEqual(self._value(args, "-vf"), "mpdecimate=max=50")
+        self.assertEqual(self._value(args, "-fps_mode"), "vfr")
+        self.assertNotIn("-g", args)
+
+    def test_audio_only_has_no_video(self):
+        args = PROFILES["flac"].encoding_args()
+        self.assertIn("-vn", args)
+        self.assertNotIn("-b:a", args)
+        self.assertEqual(PROFILES["flac"].container_args(Path("out.flac")), [])
+
+    def test_output_path_follows_the_container(self):
+        output = Path("/tmp/meeting.mp4")
+        self.assertEqual(PROFILES["standard"].output_path(output), output)
+        self.assertEqual(PROFILES["live"].output_path(output), Path("/tmp/meeting.m3u8"))
+        self.assertEqual(
+            PROFILES["archive"].output_path(output), Path("/tmp/meeting_%05d.mp4")
+        )
+        self.assertEqual(PROFILES["opus"].output_path(output), Path("/tmp/meeting.ogg"))
+
+    def test_rejects_invalid_profiles(self):
+        for settings in (
+            {"container": "avi"},
+            {"video": False, "container": "hls"},
+            {"video": False, "audio_codec": "aac"},
+        ):
+            with self.subTest(**settings), self.assertRaises(ValueError):
+                EncodingProfile(**settings)
+
+    def test_unknown_profile_name(self):
+        with self.assertRaises(ValueError):
+            encoding_profile("lossless")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,48 +1,130 @@
 import asyncio
+import contextlib
 import logging
 import os
+from pathlib import Path
 
-from examples.app.env import DBus, FFmpeg, Fluxbox, Pulseaudio, XAuth, Xvfb
+from examples.app.audio import serve_pcm
+from examples.app.bot import attend
+from examples.app.env import (
+    DBus,
+    FFmpeg,
+    Fluxbox,
+    Pulseaudio,
+    Region,
+    XAuth,
+    Xvfb,
+    encoding_profile,
+)
+from examples.app.orchestrator import Environment, Service
+from examples.app.pool import attend_all, serve
+from examples.app.telemetry import ProcessSampler
+from examples.app.templates import NATIVE_GEOMETRY, Geometry
+from examples.app.vision import set_threads
 from examples.app.zoom_app import ZoomApp
 
 _LOGGER = logging.getLogger(__name__)
 
 
 async def main():
+    # One thread by default, several bots usually share the host
+    set_threads(int(os.getenv("VISION_THREADS", "1")))
+    # "opus", "flac" and "wav" record the meeting audio without video
+    profile = os.getenv("RECORDING_PROFILE", "standard")
+    # The display of every bot, WxH@DPI, the templates are resized for it
+    geometry = Geometry.parse(os.getenv("SCREEN_GEOMETRY", NATIVE_GEOMETRY.key))
+
+    # Zygote mode, the bots are forked per job from a process which has
+    # imported the libraries and loaded the templates, jobs are sent with
+    # `pool submit`
+    zygote_socket = os.getenv("ZYGOTE_SOCKET")
+    if zygote_socket:
+        max_bots = os.getenv("MAX_BOTS")
+        await serve(0, int(max_bots) if max_bots else 1, Path(zygote_socket), geometry)
+        return
+
+    # Multi-tenant mode, every meeting gets a bot with its own display,
+    # audio sink and zoom home
+    urls = os.getenv("MEETING_URLS", "").split()
+    if urls:
+        await attend_all(
+            urls,
+            max_bots=int(os.getenv("MAX_BOTS", len(urls))),
+            profile=profile,
+            geometry=geometry,
+        )
+        return
+
     display = os.getenv("DISPLAY", ":0")
     bus_address = os.environ.get("DBUS_SESSION_BUS_ADDRESS")
     assert bus_address is not None
     url = os.getenv("MEETING_URL")
     assert url is not None
+    # The part of the screen which is recorded, WxH+X+Y
+    region = os.getenv("CAPTURE_REGION")
+    # Resource usage of the bot, exported when either is set
+    metrics_file = os.getenv("METRICS_FILE")
+    metrics_port = os.getenv("METRICS_PORT")
+    # Streams the meeting audio to local consumers while it runs
+    pcm_socket = os.getenv("PCM_SOCKET")
+
+    environment = Environment(
+        [
+            Service(
+                "xvfb",
+                Xvfb(geometry.width, geometry.height, display=display, dpi=geometry.dpi),
+            ),
+            Service("xauth", XAuth(display=display)),
+            Service("fluxbox", Fluxbox(display=display), after=("xvfb", "xauth")),
+            Service("dbus", DBus(bus_address=bus_address)),
+            Service("pulseaudio", Pulseaudio()),
+            Service(
+                "ffmpeg",
+                FFmpeg(
+                    geometry.width,
+                    geometry.height,
+                    display=display,
+                    profile=encoding_profile(profile),
+                    region=Region.parse(region) if region else None,
+                ),
+                after=("xvfb", "pulseaudio"),
+            ),
+        ]
+    )
+    async with environment:
+        xvfb = environment["xvfb"]
+        zoom = await ZoomApp.create(
+            logger=_LOGGER,
+            geometry=Geometry(xvfb.width, xvfb.height, xvfb.dpi),
+        )
+        sampler = ProcessSampler()
+        sampler.track("python", os.getpid())
+        for name in ("xvfb", "fluxbox", "ffmpeg"):
+            sampler.track(name, environment[name].proc.pid)
+        # Both fork away from the process which started them
+        sampler.track_command("dbus", "dbus-daemon")
+        sampler.track_command("pulseaudio", "pulseaudio")
+        sampler.track("zoom", zoom.proc.pid, children=True)
+        telemetry = None
+        if metrics_file or metrics_port:
+            telemetry = asyncio.create_task(
+                sampler.run(
+                    Path(metrics_file) if metrics_file else None,
+                    int(metrics_port) if metrics_port else None,
+                )
+            )
 
-    with Xvfb(display=display):
-        with XAuth(display=display):
-            with Fluxbox(display=display):
-                with DBus(bus_address=bus_address):
-                    with Pulseaudio():
-                        with FFmpeg(display=display):
-                            zoom = await ZoomApp.create(logger=_LOGGER)
-
-                            try:
-                                _ = await zoom.join(url)
-                            except RuntimeError as e:
-                                import shutil
-                                shutil.copytree("/home/nonroot/.zoom", "/home/nonroot/tmp/zoom")
-                                _LOGGER.info("Leaving... {repr(e)}")
-                                return
-
-                            asyncio.create_task(zoom.post_join())
-                            await zoom.send_welcome_message("Hello, world!")
-                            try:
-                                n = 180
-                                while n > 0:
-                                    await asyncio.sleep(1)
-                                    n -= 1
-                                    _LOGGER.info(f"Waiting... {n}")
-                            except Exception as e:
-                                import shutil
-                                shutil.copytree("/home/nonroot/.zoom", "/home/nonroot/tmp/zoom")
-                                _LOGGER.info(f"Leaving... {repr(e)}")
+        pcm = (
+            serve_pcm(Pulseaudio.SOURCE, Path(pcm_socket))
+            if pcm_socket
+            else contextlib.nullcontext()
+        )
+        try:
+            async with pcm:
+                await attend(zoom, url)
+        finally:
+            if telemetry is not None:
+                telemetry.cancel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,129 @@
+import asyncio
+import collections
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable
+
+_LOGGER = logging.getLogger(__name__)
+
+# The budgets of the invariants are per this many seconds
+_BUDGET_WINDOW = 60.0
+
+
+@dataclass
+class Invariant:
+    """A state of the app kept by the maintenance loop.
+
+    `check` tells whether it holds, it's None for states which can't be
+    seen without acting, like a setting which is only shown in a menu;
+    those are re-applied by `fix` on the backoff schedule instead.
+    """
+
+    name: str
+    check: Callable[[], bool] | None
+    fix: Callable[[], object]
+    min_interval: float
+    max_interval: float
+    # Seconds of vision work the invariant may take per budget window
+    budget: float
+    interval: float = field(init=False)
+    due: float = 0.0
+    # Whether the other invariants were escalated since this one last held
+    escalated: bool = False
+    spent: collections.deque = field(default_factory=collections.deque)
+
+    def __post_init__(self):
+        self.interval = self.min_interval
+
+    def over_budget(self, now: float) -> bool:
+        while self.spent and self.spent[0][0] < now - _BUDGET_WINDOW:
+            self.spent.popleft()
+        return sum(seconds for _, seconds in self.spent) >= self.budget
+
+
+class MaintenanceScheduler:
+    """Re-checks the invariants as rarely as they allow.
+
+    An invariant which holds is re-checked with exponential backoff up to
+    its `max_interval`. A violated one is fixed and polled at its
+    `min_interval` until it holds again. After the first fix of a
+    violation the invariants without a check are brought forward since
+    the screen has changed, not on every poll of the same violation.
+    """
+
+    def __init__(
+        self,
+        invariants: Iterable[Invariant],
+        run: Callable[..., Awaitable],
+        lock: asyncio.Lock,
+    ):
+        self.invariants = list(invariants)
+        # Runs a function on the vision thread
+        self._run = run
+        self._lock = lock
+
+    async def _timed(self, invariant: Invariant, func: Callable, now: float):
+        started = time.monotonic()
+        try:
+            return await self._run(func)
+        finally:
+            invariant.spent.append((now, time.monotonic() - started))
+
+    def _escalate(self, now: float) -> None:
+        for invariant in self.invariants:
+            if invariant.check is None:
+                invariant.interval = invariant.min_interval
+                invariant.due = min(invariant.due, now + invariant.min_interval)
+
+    async def _maintain(self, invariant: Invariant, now: float) -> None:
+        holds = None
+        if invariant.check is not None:
+            holds = await self._timed(invariant, invariant.check, now)
+        if holds:
+            invariant.escalated = False
+            invariant.interval = min(invariant.interval * 2, invariant.max_interval)
+            return
+
+        if holds is False:
+            _LOGGER.info({"message": "Invariant is violated", "invariant": invariant.name})
+            invariant.interval = invariant.min_interval
+        else:
+            invariant.interval = min(invariant.interval * 2, invariant.max_interval)
+        try:
+            await self._timed(invariant, invariant.fix, now)
+        except Exception as e:
+            # Nothing has changed on the screen
+            _LOGGER.warning(
+                {"message": "Failed to fix", "invariant": invariant.name, "error": repr(e)}
+            )
+            return
+        if holds is False and not invariant.escalated:
+            invariant.escalated = True
+            self._escalate(now)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            invariant = min(self.invariants, key=lambda i: i.due)
+            if invariant.due > now:
+                await asyncio.sleep(invariant.due - now)
+                continue
+
+            if invariant.over_budget(now):
+                # Skipped until its oldest spending leaves the window
+                invariant.due = invariant.spent[0][0] + _BUDGET_WINDOW
+                _LOGGER.info({"message": "Invariant is over budget", "invariant": invariant.name})
+                continue
+
+            async with self._lock:
+                await self._maintain(invariant, now)
+            invariant.due = loop.time() + invariant.interval
+            _LOGGER.debug(
+                {
+                    "message": "Invariant maintained",
+                    "invariant": invariant.name,
+                    "next_in": invariant.interval,
+                }
+            )
@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+
+from examples.app.maintenance import Invariant, MaintenanceScheduler
+
+
+async def _run(func):
+    return func()
+
+
+def _invariant(name, check, fix=lambda: None, **settings) -> Invariant:
+    settings = {"min_interval": 1, "max_interval": 8, "budget": 10, **settings}
+    return Invariant(name, check=check, fix=fix, **settings)
+
+
+class MaintenanceSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    def _scheduler(self, *invariants: Invariant) -> MaintenanceScheduler:
+        return MaintenanceScheduler(invariants, _run, asyncio.Lock())
+
+    async def test_holding_invariant_backs_off_without_fixing(self):
+        fixes = []
+        invariant = _invariant("holds", lambda: True, fix=lambda: fixes.append(1))
+        scheduler = self._scheduler(invariant)
+        intervals = []
+        for _ in range(5):
+            await scheduler._maintain(invariant, 0)
+            intervals.append(invariant.interval)
+        self.assertEqual(intervals, [2, 4, 8, 8, 8])
+        self.assertEqual(fixes, [])
+
+    async def test_violation_fixes_at_min_interval(self):
+        fixes = []
+        invariant = _invariant("violated", lambda: False, fix=lambda: fixes.append(1))
+        invariant.interval = 8
+        await self._scheduler(invariant)._maintain(invariant, 0)
+        self.assertEqual(invariant.interval, 1)
+        self.assertEqual(fixes, [1])
+
+    async def test_escalates_once_per_violation(self):
+        holds = [False]
+        violated = _invariant("violated", lambda: holds[0])
+        unchecked = _invariant("unchecked", None, max_interval=64)
+        scheduler = self._scheduler(violated, unchecked)
+
+        unchecked.interval, unchecked.due = 32, 100
+        await scheduler._maintain(violated, 0)
+        self.assertEqual((unchecked.interval, unchecked.due), (1, 1))
+
+        # Polls of the same violation leave the others alone
+        unchecked.interval, unchecked.due = 32, 100
+        await scheduler._maintain(violated, 0)
+        self.assertEqual((unchecked.interval, unchecked.due), (32, 100))
+
+        # Once it has held again the next violation escalates
+        holds[0] = True
+        await scheduler._maintain(violated, 0)
+        holds[0] = False
+        await scheduler._maintain(violated, 0)
+        self.assertEqual((unchecked.interval, unchecked.due), (1, 1))
+
+    async def test_failed_fix_does_not_escalate(self):
+        def fail():
+            raise RuntimeError("no view button")
+
+        violated = _invariant("violated", lambda: False, fix=fail)
+        unchecked = _invariant("unchecked", None, max_interval=64)
+        unchecked.interval, unchecked.due = 32, 100
+        with self.assertLogs("examples.app.maintenance", "WARNING"):
+            await self._scheduler(violated, unchecked)._maintain(violated, 0)
+        self.assertEqual((unchecked.interval, unchecked.due), (32, 100))
+
+    def test_budget_window(self):
+        invariant = _invariant("costly", None, budget=1)
+        invariant.spent.extend([(0, 0.6), (30, 0.6)])
+        self.assertTrue(invariant.over_budget(31))
+        # The first spending has left the window
+        self.assertFalse(invariant.over_budget(61))
+
+
+if __name__ == "__main__":
+    unittest.main()
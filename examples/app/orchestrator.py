@@ -0,0 +1,111 @@
+import asyncio
+import contextlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class Service:
+    name: str
+    # A context manager from env.py which returns once the service is ready
+    instance: Any
+    after: tuple[str, ...] = ()
+
+
+class Environment:
+    """Brings the services up as a dependency graph.
+
+    Every service is entered as soon as the services it depends on are
+    ready, so independent ones start concurrently. The services are
+    stopped in the reverse order they became ready.
+    """
+
+    def __init__(self, services: Iterable[Service]):
+        self._services = {service.name: service for service in services}
+        for service in self._services.values():
+            unknown = set(service.after) - self._services.keys()
+            if unknown:
+                raise ValueError(f"{service.name} depends on unknown {', '.join(unknown)}")
+        self._check_acyclic()
+        self._stack = contextlib.ExitStack()
+        # The threads entering the services, they can't be cancelled
+        self._entering: set[asyncio.Future] = set()
+
+    def _check_acyclic(self) -> None:
+        visiting, done = set(), set()
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through {name}")
+            visiting.add(name)
+            for dependency in self._services[name].after:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self._services:
+            visit(name)
+
+    def __getitem__(self, name: str) -> Any:
+        return self._services[name].instance
+
+    async def _start(self, service: Service, tasks: dict[str, asyncio.Task]) -> None:
+        await asyncio.gather(*(tasks[name] for name in service.after))
+        started = time.monotonic()
+
+        def enter() -> None:
+            service.instance.__enter__()
+            # Pushed by the thread, so a service which finishes starting
+            # after the bring-up was cancelled is still stopped
+            self._stack.push(service.instance)
+
+        entering = asyncio.ensure_future(asyncio.to_thread(enter))
+        self._entering.add(entering)
+        await asyncio.shield(entering)
+        _LOGGER.info(
+            {
+                "message": "Service is ready",
+                "service": service.name,
+                "seconds": round(time.monotonic() - started, 3),
+            }
+        )
+
+    async def __aenter__(self):
+        started = time.monotonic()
+        tasks = {}
+        for service in self._services.values():
+            tasks[service.name] = asyncio.create_task(self._start(service, tasks))
+
+        # Let the services which are starting finish even if one has failed,
+        # otherwise they couldn't be stopped
+        try:
+            results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        except BaseException:
+            # Cancelled, gather has cancelled the services waiting to start
+            await self._unwind()
+            raise
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            await self._unwind()
+            raise errors[0]
+
+        _LOGGER.info(
+            {
+                "message": "Environment is ready",
+                "seconds": round(time.monotonic() - started, 3),
+            }
+        )
+        return self
+
+    async def _unwind(self) -> None:
+        await asyncio.gather(*self._entering, return_exceptions=True)
+        await asyncio.to_thread(self._stack.close)
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        await asyncio.to_thread(self._stack.__exit__, exc_type, exc_value, exc_tb)
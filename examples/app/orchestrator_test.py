@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import unittest
+
+from examples.app.orchestrator import Environment, Service
+
+
+class _FakeService:
+    def __init__(self, name: str, events: list, fail: bool = False):
+        self.name = name
+        self.events = events
+        self.fail = fail
+        self.entering = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __enter__(self):
+        self.entering.set()
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError(f"{self.name} failed")
+        self.events.append(("enter", self.name))
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.events.append(("exit", self.name))
+
+
+class EnvironmentTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.events = []
+
+    def _service(self, name: str, after: tuple[str, ...] = (), **kwargs) -> Service:
+        return Service(name, _FakeService(name, self.events, **kwargs), after=after)
+
+    async def test_dependencies_start_first_and_stop_last(self):
+        async with Environment(
+            [self._service("fluxbox", after=("xvfb",)), self._service("xvfb")]
+        ):
+            self.assertEqual(self.events, [("enter", "xvfb"), ("enter", "fluxbox")])
+        self.assertEqual(self.events[2:], [("exit", "fluxbox"), ("exit", "xvfb")])
+
+    def test_rejects_unknown_dependencies_and_cycles(self):
+        with self.assertRaises(ValueError):
+            Environment([self._service("fluxbox", after=("xvfb",))])
+        with self.assertRaises(ValueError):
+            Environment([self._service("a", after=("b",)), self._service("b", after=("a",))])
+
+    async def test_failure_stops_the_started_services(self):
+        environment = Environment(
+            [
+                self._service("dbus"),
+                self._service("xvfb", fail=True),
+                self._service("fluxbox", after=("xvfb",)),
+            ]
+        )
+        with self.assertRaisesRegex(RuntimeError, "xvfb failed"):
+            async with environment:
+                pass
+        self.assertEqual(self.events, [("enter", "dbus"), ("exit", "dbus")])
+
+    async def test_cancelled_bring_up_stops_the_services_still_starting(self):
+        pulseaudio = self._service("pulseaudio")
+        pulseaudio.instance.release.clear()
+        environment = Environment(
+            [
+                self._service("dbus"),
+                pulseaudio,
+                self._service("ffmpeg", after=("pulseaudio",)),
+            ]
+        )
+        bring_up = asyncio.create_task(environment.__aenter__())
+        await asyncio.to_thread(pulseaudio.instance.entering.wait, 5)
+        bring_up.cancel()
+        # Pulseaudio finishes starting after the cancellation
+        pulseaudio.instance.release.set()
+        with self.assertRaises(asyncio.CancelledError):
+            await bring_up
+        self.assertCountEqual(
+            self.events,
+            [
+                ("enter", "dbus"),
+                ("enter", "pulseaudio"),
+                ("exit", "dbus"),
+                ("exit", "pulseaudio"),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,493 @@
+"""Warm pool of bot environments behind a local job socket.
+
+Every worker process brings up its own display and audio sink, launches
+zoom and waits on the zoom home screen. A meeting job is handed to a
+ready worker and a new one is started in the background to keep the pool
+full. At most `--max-bots` workers attend meetings at the same time.
+
+    pool serve --size 2 --max-bots 4
+    pool serve --size 0 --max-bots 4  # a fresh bot per job
+    pool serve --size 2 --geometry 960x540@72
+    pool submit <meeting-url> --profile economy
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import uuid
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from pathlib import Path
+
+from examples.app.audio import serve_pcm
+from examples.app.bot import attend
+from examples.app.env import (
+    DBus,
+    FFmpeg,
+    Fluxbox,
+    Pulseaudio,
+    PulseSink,
+    XAuth,
+    Xvfb,
+    encoding_profile,
+)
+from examples.app.orchestrator import Environment, Service
+from examples.app.telemetry import ProcessSampler
+from examples.app.templates import NATIVE_GEOMETRY, Geometry
+from examples.app.vision import set_threads
+from examples.app.zoom_app import ZoomApp
+
+_LOGGER = logging.getLogger(__name__)
+
+_SOCKET = Path("/home/nonroot/0/callbot.sock")
+_OUTPUT_DIR = Path("/home/nonroot/tmp")
+# Every worker gets its own zoom home under this directory
+_HOMES_DIR = Path("/home/nonroot/bots")
+# The display of the first worker, :0 is left for the single bot mode
+_FIRST_DISPLAY = 1
+# Delay before a worker which died while warm is replaced
+_RESPAWN_DELAY = 5
+# How long a stopped worker may take to tear down its environment
+_STOP_TIMEOUT = 30
+# The live audio of a job which asked for it, relative to its directory
+_PCM_SOCKET = "pcm.sock"
+# Every worker exports its resource usage here, for the textfile collector
+_METRICS_DIR = "metrics"
+# Imported by the fork server before any worker is forked
+_PRELOAD = ["examples.app.preload"]
+
+
+def _authority(display_number: int) -> Path:
+    return _HOMES_DIR / str(display_number) / ".Xauthority"
+
+
+async def _recv(conn: Connection):
+    """Receives from the pipe without a thread which can't be cancelled."""
+    loop = asyncio.get_running_loop()
+    readable = loop.create_future()
+    loop.add_reader(conn.fileno(), lambda: readable.done() or readable.set_result(None))
+    try:
+        await readable
+    finally:
+        loop.remove_reader(conn.fileno())
+    return conn.recv()
+
+
+async def _serve_worker(
+    display_number: int, conn: Connection, output_dir: Path, geometry: Geometry
+) -> None:
+    # The pool stops the worker with SIGTERM, the environment is torn down
+    # as the task is cancelled
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    display = f":{display_number}"
+    home = _HOMES_DIR / str(display_number)
+    home.mkdir(parents=True, exist_ok=True)
+    # Zoom runs with this home, so it finds the cookie as ~/.Xauthority
+    authority = _authority(display_number)
+
+    environment = Environment(
+        [
+            Service(
+                "xvfb",
+                Xvfb(
+                    geometry.width,
+                    geometry.height,
+                    display=display,
+                    dpi=geometry.dpi,
+                    authority=str(authority),
+                ),
+            ),
+            Service("xauth", XAuth(display=display, authority=authority)),
+            Service("fluxbox", Fluxbox(display=display), after=("xvfb", "xauth")),
+            Service("audio", PulseSink(f"{Pulseaudio.SINK}_{display_number}")),
+        ]
+    )
+    async with environment:
+        xvfb, audio = environment["xvfb"], environment["audio"]
+        zoom = await ZoomApp.create(
+            logger=_LOGGER,
+            geometry=Geometry(xvfb.width, xvfb.height, xvfb.dpi),
+            display=display,
+            home=home,
+            audio_sink=audio.name,
+        )
+        sampler = ProcessSampler(labels={"display": display})
+        sampler.track("python", os.getpid())
+        sampler.track("xvfb", xvfb.proc.pid)
+        sampler.track("fluxbox", environment["fluxbox"].proc.pid)
+        sampler.track("zoom", zoom.proc.pid, children=True)
+        telemetry = asyncio.create_task(
+            sampler.run(output_dir / _METRICS_DIR / f"bot-{display_number}.prom")
+        )
+        try:
+            await zoom.wait_home_screen()
+            conn.send({"status": "ready"})
+
+            job = await _recv(conn)
+            job_dir = output_dir / job["id"]
+            _LOGGER.info({"message": "Starting job", "job": job, "display": display})
+            pcm = (
+                serve_pcm(audio.monitor, job_dir / _PCM_SOCKET)
+                if job["pcm"]
+                else contextlib.nullcontext()
+            )
+            recording = FFmpeg(
+                xvfb.width,
+                xvfb.height,
+                display=display,
+                output=job_dir / "output.mp4",
+                audio_source=audio.monitor,
+                profile=encoding_profile(job["profile"]),
+            )
+            async with pcm:
+                with recording:
+                    sampler.track("ffmpeg", recording.proc.pid)
+                    await attend(zoom, job["meeting_url"], logs_dir=job_dir / "zoom")
+        finally:
+            telemetry.cancel()
+            await zoom.exit()
+    conn.send({"status": "done"})
+
+
+def run_worker(
+    display_number: int, conn: Connection, output_dir: Path, geometry: Geometry
+) -> None:
+    logging.basicConfig(level=logging.INFO)
+    # The services of the worker share its process group, which is killed
+    # when the worker doesn't stop in time
+    os.setsid()
+    # XTest and the screen grabber are opened on the display explicitly,
+    # the pyautogui fallback binds to DISPLAY when it's imported
+    os.environ["DISPLAY"] = f":{display_number}"
+    os.environ["XAUTHORITY"] = str(_authority(display_number))
+    set_threads(int(os.getenv("VISION_THREADS", "1")))
+    # Cancelled by SIGTERM once the environment is torn down
+    with contextlib.suppress(asyncio.CancelledError):
+        asyncio.run(_serve_worker(display_number, conn, output_dir, geometry))
+
+
+@dataclass
+class _Worker:
+    display: int
+    process: multiprocessing.Process
+    conn: Connection
+    job: dict | None = None
+    # Resolved once the worker has exited
+    done: asyncio.Future = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+
+class WarmPool:
+    """Keeps `size` workers started and idling on the zoom home screen.
+
+    With no `size` a worker is forked for every job as it comes. When the
+    number of `jobs` is known no more workers are started than they take.
+
+    No more than `max_bots` workers are in meetings at once, further jobs
+    wait for one of them to finish.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        max_bots: int | None = None,
+        output_dir: Path = _OUTPUT_DIR,
+        jobs: int | None = None,
+        geometry: Geometry = NATIVE_GEOMETRY,
+    ):
+        self.size = size
+        self.max_bots = max_bots or size or 1
+        self.output_dir = output_dir
+        self.geometry = geometry
+        self.jobs = jobs
+        # Workers are forked from a server which has imported the app and
+        # loaded the templates, so they don't inherit the event loop but
+        # share its memory
+        self._context = multiprocessing.get_context("forkserver")
+        self._context.set_forkserver_preload(_PRELOAD)
+        # Read by the preload, the fork server starts with the first worker
+        os.environ["SCREEN_GEOMETRY"] = geometry.key
+        self._slots = asyncio.Semaphore(self.max_bots)
+        self._ready: asyncio.Queue[_Worker] = asyncio.Queue()
+        self._displays: set[int] = set()
+        self._tasks: set[asyncio.Task] = set()
+        # Workers started and not given a job yet, and the jobs given
+        self._warm = 0
+        self._assigned = 0
+
+    def start(self) -> None:
+        for _ in range(self.size):
+            if self._wanted():
+                self._spawn()
+
+    def _wanted(self) -> bool:
+        """Whether one more warm worker would get a job."""
+        return self.jobs is None or self._assigned + self._warm < self.jobs
+
+    def _spawn(self) -> None:
+        display = _FIRST_DISPLAY
+        while display in self._displays:
+            display += 1
+        self._displays.add(display)
+        self._warm += 1
+
+        conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=run_worker,
+            args=(display, child_conn, self.output_dir, self.geometry),
+            name=f"bot-{display}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+
+        task = asyncio.create_task(self._supervise(_Worker(display, process, conn)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _supervise(self, worker: _Worker) -> None:
+        ready = False
+        try:
+            message = await _recv(worker.conn)
+            if message.get("status") == "ready":
+                _LOGGER.info({"message": "Worker is ready", "display": worker.display})
+                ready = True
+                self._ready.put_nowait(worker)
+                message = await _recv(worker.conn)
+            _LOGGER.info(
+                {"message": "Worker is done", "display": worker.display, "job": worker.job}
+            )
+        except EOFError:
+            _LOGGER.error(
+                {
+                    "message": "Worker died",
+                    "display": worker.display,
+                    "job": worker.job,
+                    "exitcode": worker.process.exitcode,
+                }
+            )
+        except asyncio.CancelledError:
+            await self._stop(worker)
+            raise
+        finally:
+            await asyncio.to_thread(worker.process.join)
+            worker.conn.close()
+            self._displays.discard(worker.display)
+            if worker.job is not None:
+                self._slots.release()
+            else:
+                self._warm -= 1
+            worker.done.set_result(worker.process.exitcode)
+
+        if worker.job is not None:
+            return
+        if not self.size:
+            # The job which forked the worker is waiting for it, it starts
+            # another one once it gets the dead worker
+            if not ready:
+                self._ready.put_nowait(worker)
+        elif self._wanted():
+            # A worker which died while warm is replaced, busy ones were
+            # replaced when they got their job
+            await asyncio.sleep(_RESPAWN_DELAY)
+            self._spawn()
+
+    async def _stop(self, worker: _Worker) -> None:
+        worker.process.terminate()
+        await asyncio.to_thread(worker.process.join, _STOP_TIMEOUT)
+        if worker.process.is_alive():
+            _LOGGER.warning(
+                {"message": "Worker didn't stop, killing", "display": worker.display}
+            )
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(worker.process.pid, signal.SIGKILL)
+
+    async def _assign(self, meeting_url: str, profile: str, pcm: bool = False) -> _Worker:
+        # Fail the job before it takes a worker
+        encoding_profile(profile)
+        await self._slots.acquire()
+        try:
+            while True:
+                if not self.size:
+                    # Without warm workers every job gets a fresh one
+                    self._spawn()
+                worker = await self._ready.get()
+                if worker.process.is_alive():
+                    break
+                if not self.size:
+                    await asyncio.sleep(_RESPAWN_DELAY)
+        except BaseException:
+            self._slots.release()
+            raise
+        worker.job = {
+            "id": uuid.uuid4().hex,
+            "meeting_url": meeting_url,
+            "profile": profile,
+            "pcm": pcm,
+        }
+        worker.conn.send(worker.job)
+        self._warm -= 1
+        self._assigned += 1
+        if self.size and self._wanted():
+            self._spawn()
+        return worker
+
+    async def submit(self, meeting_url: str, profile: str = "standard", pcm: bool = False) -> dict:
+        worker = await self._assign(meeting_url, profile, pcm)
+        response = {"id": worker.job["id"], "display": f":{worker.display}"}
+        if pcm:
+            response["pcm_socket"] = str(self.output_dir / worker.job["id"] / _PCM_SOCKET)
+        return response
+
+    async def run(self, meeting_url: str, profile: str = "standard") -> int | None:
+        """Attends the meeting and returns the exit code of the worker."""
+        worker = await self._assign(meeting_url, profile)
+        return await asyncio.shield(worker.done)
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def _handle_client(
+    pool: WarmPool, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    try:
+        while line := await reader.readline():
+            try:
+                request = json.loads(line)
+                job = await pool.submit(
+                    request["meeting_url"],
+                    request.get("profile", "standard"),
+                    bool(request.get("pcm", False)),
+                )
+                response = {"status": "accepted", **job}
+            except (ValueError, KeyError, TypeError) as e:
+                response = {"status": "error", "error": repr(e)}
+            writer.write(json.dumps(response).encode("utf8") + b"\n")
+            await writer.drain()
+    except ConnectionError as e:
+        # The job is running anyway, the client just doesn't learn about it
+        _LOGGER.warning({"message": "Client went away", "error": repr(e)})
+    finally:
+        writer.close()
+
+
+def _shared_environment() -> Environment:
+    bus_address = os.environ.get("DBUS_SESSION_BUS_ADDRESS")
+    assert bus_address is not None
+
+    # The daemons are shared by all the workers, every worker loads a sink
+    # of its own into the pulseaudio
+    return Environment(
+        [
+            Service("dbus", DBus(bus_address=bus_address)),
+            Service("pulseaudio", Pulseaudio()),
+        ]
+    )
+
+
+async def attend_all(
+    meeting_urls: list[str],
+    max_bots: int,
+    profile: str = "standard",
+    geometry: Geometry = NATIVE_GEOMETRY,
+) -> list[int | None]:
+    """Attends the meetings with up to `max_bots` concurrent bots."""
+    async with _shared_environment():
+        pool = WarmPool(
+            min(max_bots, len(meeting_urls)),
+            max_bots=max_bots,
+            jobs=len(meeting_urls),
+            geometry=geometry,
+        )
+        pool.start()
+        try:
+            return await asyncio.gather(*(pool.run(url, profile) for url in meeting_urls))
+        finally:
+            await pool.close()
+
+
+async def serve(
+    size: int,
+    max_bots: int | None,
+    socket_path: Path,
+    geometry: Geometry = NATIVE_GEOMETRY,
+) -> None:
+    async with _shared_environment():
+        pool = WarmPool(size, max_bots=max_bots, geometry=geometry)
+        pool.start()
+
+        socket_path.unlink(missing_ok=True)
+        server = await asyncio.start_unix_server(
+            lambda r, w: _handle_client(pool, r, w), path=str(socket_path)
+        )
+        _LOGGER.info(
+            {
+                "message": "Accepting jobs",
+                "socket": str(socket_path),
+                "size": size,
+                "max_bots": pool.max_bots,
+                "geometry": geometry.key,
+            }
+        )
+        async with server:
+            await server.serve_forever()
+
+
+async def submit(meeting_url: str, profile: str, pcm: bool, socket_path: Path) -> dict:
+    reader, writer = await asyncio.open_unix_connection(str(socket_path))
+    try:
+        request = {"meeting_url": meeting_url, "profile": profile, "pcm": pcm}
+        writer.write(json.dumps(request).encode("utf8") + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--socket", type=Path, default=Path(os.getenv("POOL_SOCKET", _SOCKET)))
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Run the pool")
+    serve_parser.add_argument("--size", type=int, default=int(os.getenv("POOL_SIZE", "1")))
+    serve_parser.add_argument(
+        "--max-bots",
+        type=int,
+        default=int(os.getenv("MAX_BOTS", "0")) or None,
+        help="Bots in meetings at once, the pool size by default",
+    )
+    serve_parser.add_argument(
+        "--geometry",
+        type=Geometry.parse,
+        default=os.getenv("SCREEN_GEOMETRY", NATIVE_GEOMETRY.key),
+        help="Display of every bot, WxH@DPI",
+    )
+    submit_parser = commands.add_parser("submit", help="Send a meeting to the pool")
+    submit_parser.add_argument("meeting_url")
+    submit_parser.add_argument("--profile", default="standard", help="Recording encoding profile")
+    submit_parser.add_argument(
+        "--pcm", action="store_true", help="Stream the meeting audio to a socket in the job directory"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        asyncio.run(serve(args.size, args.max_bots, args.socket, args.geometry))
+        return 0
+
+    response = asyncio.run(submit(args.meeting_url, args.profile, args.pcm, args.socket))
+    print(json.dumps(response))
+    return 0 if response.get("status") == "accepted" else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
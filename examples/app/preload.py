@@ -0,0 +1,25 @@
+"""Imported once by the fork server of the bot supervisor.
+
+The bots are forked from it, so they start with the libraries imported
+and share the decoded element images copy-on-write.
+"""
+import gc
+import os
+
+# pyautogui itself opens a connection to the display when it's imported,
+# which can't be shared by the forked bots, only its dependencies are
+import nodriver  # noqa: F401
+import PIL.Image  # noqa: F401
+import pyscreeze  # noqa: F401
+import pytweening  # noqa: F401
+
+from examples.app import bot  # noqa: F401
+from examples.app.templates import NATIVE_GEOMETRY, Geometry
+from examples.app.zoom_app import load_templates
+
+# The pool passes the geometry of its bots in the environment
+load_templates(Geometry.parse(os.getenv("SCREEN_GEOMETRY", NATIVE_GEOMETRY.key)))
+
+# The collector of a bot would otherwise write to the headers of all
+# these objects and copy the pages they are on
+gc.freeze()
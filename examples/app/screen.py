@@ -0,0 +1,291 @@
+import ctypes
+import ctypes.util
+import logging
+import threading
+from typing import Callable
+
+import cv2
+import numpy as np
+
+_LOGGER = logging.getLogger(__name__)
+
+_ZPIXMAP = 2
+_ALL_PLANES = ctypes.c_ulong(-1).value
+_IPC_PRIVATE = 0
+_IPC_CREAT = 0o1000
+_IPC_RMID = 0
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class _XImage(ctypes.Structure):
+    # Only the leading fields of XImage are declared, the image is never
+    # allocated on the python side
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+    ]
+
+
+_X_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+
+
+def _load_library(name: str) -> ctypes.CDLL:
+    path = ctypes.util.find_library(name)
+    if path is None:
+        raise RuntimeError(f"lib{name} is not found")
+    return ctypes.CDLL(path, use_errno=True)
+
+
+def _bind(lib: ctypes.CDLL, name: str, restype, *argtypes):
+    func = getattr(lib, name)
+    func.restype = restype
+    func.argtypes = argtypes
+    return func
+
+
+class XShmGrabber:
+    """Captures the X screen through the MIT-SHM extension.
+
+    The X server writes the root window straight into a shared memory
+    segment. The segment is overwritten by every capture, so the frame is
+    copied out of it before the lock is released: `grab` copies the BGRA
+    frame, `grab_gray` converts it, which is the only copy per frame.
+    """
+
+    to_gray = cv2.COLOR_BGRA2GRAY
+
+    def __init__(self, display: str | None = None):
+        x11 = _load_library("X11")
+        xext = _load_library("Xext")
+        libc = _load_library("c")
+
+        self._XOpenDisplay = _bind(x11, "XOpenDisplay", ctypes.c_void_p, ctypes.c_char_p)
+        self._XCloseDisplay = _bind(x11, "XCloseDisplay", ctypes.c_int, ctypes.c_void_p)
+        self._XSync = _bind(x11, "XSync", ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+        self._XDestroyImage = _bind(
+            x11, "XDestroyImage", ctypes.c_int, ctypes.POINTER(_XImage)
+        )
+        self._XShmDetach = _bind(
+            xext, "XShmDetach", ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)
+        )
+        self._XShmGetImage = _bind(
+            xext,
+            "XShmGetImage",
+            ctypes.c_int,
+            ctypes.c_void_p,
+            ctypes.c_ulong,
+            ctypes.POINTER(_XImage),
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_ulong,
+        )
+        self._shmdt = _bind(libc, "shmdt", ctypes.c_int, ctypes.c_void_p)
+
+        # The default Xlib handler exits the process on any protocol error,
+        # the attach is the call expected to fail on a remote display
+        self._x_errors = []
+        self._error_handler = _X_ERROR_HANDLER(self._on_x_error)
+        self._XSetErrorHandler = _bind(
+            x11, "XSetErrorHandler", ctypes.c_void_p, ctypes.c_void_p
+        )
+
+        self._display = self._XOpenDisplay(display.encode("utf8") if display else None)
+        if not self._display:
+            raise RuntimeError(f"Failed to open display {display}")
+
+        self._shminfo = _XShmSegmentInfo()
+        self._image = None
+        try:
+            if not _bind(xext, "XShmQueryExtension", ctypes.c_int, ctypes.c_void_p)(
+                self._display
+            ):
+                raise RuntimeError(f"MIT-SHM is not supported by display {display}")
+
+            screen = _bind(x11, "XDefaultScreen", ctypes.c_int, ctypes.c_void_p)(
+                self._display
+            )
+            self._root = _bind(
+                x11, "XRootWindow", ctypes.c_ulong, ctypes.c_void_p, ctypes.c_int
+            )(self._display, screen)
+            visual = _bind(
+                x11, "XDefaultVisual", ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int
+            )(self._display, screen)
+            depth = _bind(x11, "XDefaultDepth", ctypes.c_int, ctypes.c_void_p, ctypes.c_int)(
+                self._display, screen
+            )
+            width = _bind(x11, "XDisplayWidth", ctypes.c_int, ctypes.c_void_p, ctypes.c_int)(
+                self._display, screen
+            )
+            height = _bind(x11, "XDisplayHeight", ctypes.c_int, ctypes.c_void_p, ctypes.c_int)(
+                self._display, screen
+            )
+
+            self._image = _bind(
+                xext,
+                "XShmCreateImage",
+                ctypes.POINTER(_XImage),
+                ctypes.c_void_p,
+                ctypes.c_void_p,
+                ctypes.c_uint,
+                ctypes.c_int,
+                ctypes.c_void_p,
+                ctypes.POINTER(_XShmSegmentInfo),
+                ctypes.c_uint,
+                ctypes.c_uint,
+            )(self._display, visual, depth, _ZPIXMAP, None, self._shminfo, width, height)
+            if not self._image:
+                raise RuntimeError("Failed to create the shared memory image")
+            image = self._image.contents
+            if image.bits_per_pixel != 32:
+                raise RuntimeError(f"Unsupported pixel format ({image.bits_per_pixel} bpp)")
+
+            size = image.bytes_per_line * image.height
+            self._shminfo.shmid = _bind(
+                libc, "shmget", ctypes.c_int, ctypes.c_int, ctypes.c_size_t, ctypes.c_int
+            )(_IPC_PRIVATE, size, _IPC_CREAT | 0o600)
+            if self._shminfo.shmid < 0:
+                raise RuntimeError(f"shmget failed ({ctypes.get_errno()})")
+            shmaddr = _bind(
+                libc, "shmat", ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_int
+            )(self._shminfo.shmid, None, 0)
+            if shmaddr in (None, ctypes.c_void_p(-1).value):
+                raise RuntimeError(f"shmat failed ({ctypes.get_errno()})")
+            self._shminfo.shmaddr = shmaddr
+            self._shminfo.readOnly = 0
+            image.data = shmaddr
+
+            # The handler is process-wide, the previous one is restored once
+            # the errors of the attach have arrived
+            previous = self._XSetErrorHandler(
+                ctypes.cast(self._error_handler, ctypes.c_void_p)
+            )
+            try:
+                if not _bind(
+                    xext,
+                    "XShmAttach",
+                    ctypes.c_int,
+                    ctypes.c_void_p,
+                    ctypes.POINTER(_XShmSegmentInfo),
+                )(self._display, self._shminfo):
+                    raise RuntimeError("XShmAttach failed")
+                self._XSync(self._display, 0)
+            finally:
+                self._XSetErrorHandler(previous)
+            # The segment is released as soon as both sides detach from it
+            _bind(libc, "shmctl", ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_void_p)(
+                self._shminfo.shmid, _IPC_RMID, None
+            )
+            if self._x_errors:
+                raise RuntimeError(f"XShmAttach failed: {self._x_errors}")
+        except Exception:
+            self.close()
+            raise
+
+        buffer = (ctypes.c_ubyte * size).from_address(shmaddr)
+        self._frame = np.ndarray(
+            shape=(image.height, image.width, 4),
+            dtype=np.uint8,
+            buffer=buffer,
+            strides=(image.bytes_per_line, 4, 1),
+        )
+        self._frame.flags.writeable = False
+        self._lock = threading.Lock()
+
+        _LOGGER.info(
+            {
+                "message": "XShm screen grabber is ready",
+                "display": display,
+                "size": f"{image.width}x{image.height}",
+            }
+        )
+
+    def _on_x_error(self, display, event) -> int:
+        self._x_errors.append(event)
+        _LOGGER.error({"message": "X error while capturing the screen"})
+        return 0
+
+    def _capture(self) -> None:
+        if not self._XShmGetImage(self._display, self._root, self._image, 0, 0, _ALL_PLANES):
+            raise RuntimeError("XShmGetImage failed")
+
+    def grab(self) -> np.ndarray:
+        with self._lock:
+            self._capture()
+            return self._frame.copy()
+
+    def grab_gray(self) -> np.ndarray:
+        with self._lock:
+            self._capture()
+            return cv2.cvtColor(self._frame, self.to_gray)
+
+    def close(self) -> None:
+        if not self._display:
+            return
+        if self._shminfo.shmaddr:
+            self._XShmDetach(self._display, self._shminfo)
+            self._XSync(self._display, 0)
+            self._shmdt(self._shminfo.shmaddr)
+            self._shminfo.shmaddr = None
+        if self._image:
+            # The data belongs to the shared memory segment, don't let Xlib free it
+            self._image.contents.data = None
+            self._XDestroyImage(self._image)
+            self._image = None
+        self._XCloseDisplay(self._display)
+        self._display = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+
+class ScreenshotGrabber:
+    """Fallback for displays without MIT-SHM, e.g. on a developer machine."""
+
+    to_gray = cv2.COLOR_RGB2GRAY
+
+    def __init__(self, screenshot: Callable):
+        self._screenshot = screenshot
+
+    def grab(self) -> np.ndarray:
+        return np.asarray(self._screenshot())
+
+    def grab_gray(self) -> np.ndarray:
+        return cv2.cvtColor(self.grab(), self.to_gray)
+
+    def close(self) -> None:
+        ...
+
+
+def open_grabber(display: str | None, screenshot: Callable) -> XShmGrabber | ScreenshotGrabber:
+    try:
+        return XShmGrabber(display)
+    except Exception as e:
+        _LOGGER.warning(
+            {
+                "message": "XShm is not available, falling back to screenshots",
+                "display": display,
+                "error": repr(e),
+            }
+        )
+        return ScreenshotGrabber(screenshot)
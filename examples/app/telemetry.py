@@ -0,0 +1,267 @@
+"""Resource usage of the bot processes and counters of the app.
+
+The processes are sampled from /proc on a fixed interval. The samples and
+the counters are exported in the Prometheus text format to a file, for
+the node exporter textfile collector, and over HTTP on localhost. Rates
+like matches per second are left to `rate()` on the counters.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+_LOGGER = logging.getLogger(__name__)
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+_PREFIX = "callbot"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def render(self, labels: str) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} counter",
+            f"{self.name}{labels} {self.value}",
+        ]
+
+
+class Summary:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+
+    @contextlib.contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def render(self, labels: str) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} summary",
+            f"{self.name}_sum{labels} {self.sum:.6f}",
+            f"{self.name}_count{labels} {self.count}",
+        ]
+
+
+# Updated by the app, the vision thread is their only writer
+TEMPLATE_MATCHES = Counter(f"{_PREFIX}_template_matches_total", "Templates matched on frames")
+SCREENSHOT_SECONDS = Summary(f"{_PREFIX}_screenshot_seconds", "Time to grab a frame")
+_METRICS = (TEMPLATE_MATCHES, SCREENSHOT_SECONDS)
+
+
+@dataclass(frozen=True)
+class _Stat:
+    ppid: int
+    ticks: int
+    threads: int
+    rss: int
+
+
+def _read_stat(pid: int) -> _Stat:
+    text = Path(f"/proc/{pid}/stat").read_text()
+    # The command in parentheses may contain spaces, the fields follow it
+    fields = text[text.rindex(")") + 2 :].split()
+    return _Stat(
+        ppid=int(fields[1]),
+        ticks=int(fields[11]) + int(fields[12]),
+        threads=int(fields[17]),
+        rss=int(fields[21]) * _PAGE_SIZE,
+    )
+
+
+def _open_fds(pid: int) -> int | None:
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except PermissionError:
+        return None
+
+
+def _pids() -> list[int]:
+    return [int(entry) for entry in os.listdir("/proc") if entry.isdigit()]
+
+
+@dataclass
+class ProcessSample:
+    processes: int = 0
+    cpu_percent: float = 0.0
+    rss_bytes: int = 0
+    open_fds: int = 0
+    threads: int = 0
+
+
+@dataclass(frozen=True)
+class _Tracked:
+    pid: int | None
+    comm: str | None
+    children: bool
+
+
+class ProcessSampler:
+    """Samples CPU, memory, descriptors and threads of named processes.
+
+    A process is tracked by its pid, optionally with everything it has
+    spawned, or by its command name for daemons which fork away from the
+    process that started them.
+    """
+
+    def __init__(self, interval: float = 5.0, labels: dict[str, str] | None = None):
+        self.interval = interval
+        self.labels = labels or {}
+        self._tracked: dict[str, _Tracked] = {}
+        self._ticks: dict[int, int] = {}
+        self._sampled_at: float | None = None
+        self.samples: dict[str, ProcessSample] = {}
+
+    def track(self, name: str, pid: int, children: bool = False) -> None:
+        self._tracked[name] = _Tracked(pid, None, children)
+
+    def track_command(self, name: str, comm: str) -> None:
+        self._tracked[name] = _Tracked(None, comm, False)
+
+    def _resolve(self, stats: dict[int, _Stat]) -> dict[str, list[int]]:
+        children: dict[int, list[int]] = {}
+        for pid, stat in stats.items():
+            children.setdefault(stat.ppid, []).append(pid)
+
+        resolved = {}
+        for name, tracked in self._tracked.items():
+            if tracked.comm is not None:
+                pids = []
+                for pid in stats:
+                    with contextlib.suppress(OSError):
+                        if Path(f"/proc/{pid}/comm").read_text().strip() == tracked.comm:
+                            pids.append(pid)
+            elif tracked.pid not in stats:
+                pids = []
+            elif tracked.children:
+                pids, pending = [], [tracked.pid]
+                while pending:
+                    pid = pending.pop()
+                    pids.append(pid)
+                    pending += children.get(pid, [])
+            else:
+                pids = [tracked.pid]
+            resolved[name] = pids
+        return resolved
+
+    def sample(self) -> dict[str, ProcessSample]:
+        now = time.monotonic()
+        elapsed = now - self._sampled_at if self._sampled_at is not None else None
+
+        stats = {}
+        for pid in _pids():
+            # Processes exit between listing and reading
+            with contextlib.suppress(OSError, ValueError, IndexError):
+                stats[pid] = _read_stat(pid)
+
+        ticks = {}
+        samples = {}
+        for name, pids in self._resolve(stats).items():
+            sample = ProcessSample()
+            for pid in pids:
+                stat = stats[pid]
+                ticks[pid] = stat.ticks
+                sample.processes += 1
+                sample.rss_bytes += stat.rss
+                sample.threads += stat.threads
+                sample.open_fds += _open_fds(pid) or 0
+                # A process seen for the first time has no baseline yet
+                if elapsed and pid in self._ticks:
+                    used = (stat.ticks - self._ticks[pid]) / _CLOCK_TICKS
+                    sample.cpu_percent += used / elapsed * 100
+            samples[name] = sample
+
+        self._ticks = ticks
+        self._sampled_at = now
+        self.samples = samples
+        return samples
+
+    def _labels(self, **extra: str) -> str:
+        labels = {**self.labels, **extra}
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+    def render(self) -> str:
+        lines = []
+        gauges = (
+            ("processes", "processes", "Processes running"),
+            ("cpu_percent", "cpu_percent", "CPU used since the last sample"),
+            ("rss_bytes", "resident_memory_bytes", "Resident memory"),
+            ("open_fds", "open_fds", "Open file descriptors"),
+            ("threads", "threads", "Threads"),
+        )
+        for field, suffix, help in gauges:
+            metric = f"{_PREFIX}_process_{suffix}"
+            lines += [f"# HELP {metric} {help}", f"# TYPE {metric} gauge"]
+            for name, sample in self.samples.items():
+                value = getattr(sample, field)
+                if isinstance(value, float):
+                    value = round(value, 2)
+                lines.append(f"{metric}{self._labels(process=name)} {value}")
+        for metric in _METRICS:
+            lines += metric.render(self._labels())
+        return "\n".join(lines) + "\n"
+
+    def _write(self, path: Path, text: str) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(text)
+        # The collector must never read a half written file
+        tmp.replace(path)
+
+    async def _respond(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            # The request itself doesn't matter, everything is on one page
+            while (await reader.readline()).strip():
+                pass
+            body = self.render().encode("utf8")
+            writer.write(
+                b"HTTP/1.0 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode("utf8")
+                + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def run(self, path: Path | None = None, port: int | None = None) -> None:
+        """Samples until cancelled, exporting to `path` and on `port`."""
+        server = None
+        if port is not None:
+            server = await asyncio.start_server(self._respond, "127.0.0.1", port)
+            _LOGGER.info({"message": "Serving metrics", "port": port})
+        try:
+            while True:
+                self.sample()
+                if path is not None:
+                    self._write(path, self.render())
+                await asyncio.sleep(self.interval)
+        finally:
+            if server is not None:
+                server.close()
@@ -0,0 +1,118 @@
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+import cv2
+import numpy as np
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Geometry:
+    width: int
+    height: int
+    dpi: int = 96
+
+    @property
+    def key(self) -> str:
+        return f"{self.width}x{self.height}@{self.dpi}"
+
+    @classmethod
+    def parse(cls, geometry: str) -> "Geometry":
+        """Parses WxH or WxH@DPI, the format of `key`."""
+        size, _, dpi = geometry.partition("@")
+        width, _, height = size.partition("x")
+        try:
+            return cls(int(width), int(height), int(dpi or 96))
+        except ValueError:
+            raise ValueError(f"Expected WxH@DPI, got {geometry}")
+
+    def scale_from(self, other: "Geometry") -> float:
+        """How much larger the UI is on this display than on the other one.
+
+        Only the DPI counts: zoom draws its buttons at a size in points, a
+        larger screen shows more around them rather than larger ones.
+        """
+        return self.dpi / other.dpi
+
+
+# The display the element images were captured on
+NATIVE_GEOMETRY = Geometry(1280, 720, 96)
+
+
+class Templates:
+    """Element images decoded once and kept in memory as grayscale arrays.
+
+    The images are resized to the DPI of the display the bot runs on, so
+    one pack captured at `NATIVE_GEOMETRY` serves other displays too.
+    Besides that the registry can keep downscaled variants of every
+    template, keyed by the scale factor.
+    """
+
+    def __init__(
+        self, name: str, geometry: Geometry, images: dict[str, dict[float, np.ndarray]]
+    ):
+        self.name = name
+        self.geometry = geometry
+        self._images = images
+
+    @classmethod
+    def load(
+        cls,
+        directory: Path,
+        required: Iterable[str] = (),
+        scales: Iterable[float] = (),
+        geometry: Geometry = NATIVE_GEOMETRY,
+    ) -> "Templates":
+        display_scale = geometry.scale_from(NATIVE_GEOMETRY)
+        images = {}
+        for path in sorted(directory.glob("*.png")):
+            image = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                raise RuntimeError(f"Failed to decode element {path}")
+            if display_scale != 1.0:
+                image = cv2.resize(
+                    image,
+                    None,
+                    fx=display_scale,
+                    fy=display_scale,
+                    interpolation=cv2.INTER_AREA if display_scale < 1 else cv2.INTER_CUBIC,
+                )
+            images[path.stem] = {1.0: image}
+            for scale in scales:
+                images[path.stem][scale] = cv2.resize(
+                    image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+                )
+
+        missing = sorted(set(required) - images.keys())
+        if missing:
+            raise RuntimeError(f"Missing elements in {directory}: {', '.join(missing)}")
+
+        _LOGGER.info(
+            {
+                "message": "Loaded element templates",
+                "directory": str(directory),
+                "geometry": geometry.key,
+                "scale": round(display_scale, 3),
+                "templates": len(images),
+                "bytes": sum(v.nbytes for t in images.values() for v in t.values()),
+            }
+        )
+        name = directory.name
+        if geometry != NATIVE_GEOMETRY:
+            name = f"{name}@{geometry.key}"
+        return cls(name, geometry, images)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._images
+
+    def __iter__(self):
+        return iter(self._images)
+
+    def get(self, name: str, scale: float = 1.0) -> np.ndarray:
+        try:
+            return self._images[name][scale]
+        except KeyError:
+            raise RuntimeError(f"Element {name} at scale {scale} is not loaded") from None
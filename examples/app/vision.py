@@ -0,0 +1,401 @@
+import json
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+import cv2
+import numpy as np
+
+from examples.app.screen import ScreenshotGrabber, XShmGrabber
+from examples.app.telemetry import SCREENSHOT_SECONDS, TEMPLATE_MATCHES
+from examples.app.templates import Templates
+
+_LOGGER = logging.getLogger(__name__)
+
+# Pixels around the last seen location which are searched before the full frame
+_ROI_MARGIN = 24
+# Frames are compared on thumbnails downscaled by this factor
+_THUMBNAIL_SCALE = 8
+# Largest difference of a thumbnail pixel which is still considered unchanged
+_CHANGE_THRESHOLD = 4
+# Share of its area which changes when an element appears
+_APPEARED_SHARE = 0.5
+# Coarse candidates refined at full resolution per element
+_PYRAMID_CANDIDATES = 3
+# How much lower than the requested confidence a coarse candidate may score
+_PYRAMID_SLACK = 0.2
+# Templates smaller than this at the coarse scale are matched at full resolution
+_PYRAMID_MIN_SIZE = 8
+# Size change of a template between its scale variants
+_VARIANT_STEP_PIXELS = 2
+
+
+def set_threads(count: int) -> None:
+    """Limits the threads OpenCV uses, the setting is process wide.
+
+    Several bots on one host each run their own matching, letting every
+    one of them use all the cores only makes them fight for the CPU.
+    """
+    cv2.setNumThreads(count)
+    _LOGGER.info({"message": "OpenCV threads", "threads": cv2.getNumThreads()})
+
+
+@dataclass(frozen=True)
+class Match:
+    name: str
+    left: int
+    top: int
+    width: int
+    height: int
+    confidence: float
+
+    @property
+    def center(self) -> tuple[int, int]:
+        return self.left + self.width // 2, self.top + self.height // 2
+
+
+class LocationIndex:
+    """Remembers where every element was seen last time.
+
+    The index is stored as json next to the other outputs of the bot, one
+    file per template pack, so the locations survive restarts. Changes
+    are kept in memory and written by `flush`, which the detector calls
+    when it's closed, not on the matching path.
+    """
+
+    def __init__(self, path: Path, locations: dict[str, tuple[int, int]]):
+        self.path = path
+        self._locations = locations
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path: Path) -> "LocationIndex":
+        locations = {}
+        if path.exists():
+            try:
+                stored = json.loads(path.read_text())
+                if not isinstance(stored, dict):
+                    raise ValueError(f"Expected an object, got {type(stored).__name__}")
+                locations = {
+                    name: (int(left), int(top)) for name, (left, top) in stored.items()
+                }
+            except (ValueError, TypeError) as e:
+                _LOGGER.warning(
+                    {
+                        "message": "Ignoring broken location index",
+                        "path": str(path),
+                        "error": repr(e),
+                    }
+                )
+        return cls(path, locations)
+
+    def get(self, name: str) -> tuple[int, int] | None:
+        return self._locations.get(name)
+
+    def update(self, match: "Match") -> None:
+        location = (match.left, match.top)
+        if self._locations.get(match.name) == location:
+            return
+        self._locations[match.name] = location
+        self._dirty = True
+
+    def flush(self) -> None:
+        if self._dirty:
+            self.save()
+
+    def save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Several bots may share the index
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self._locations, sort_keys=True))
+            tmp.replace(self.path)
+            self._dirty = False
+        except OSError as e:
+            _LOGGER.warning(
+                {
+                    "message": "Failed to save location index",
+                    "path": str(self.path),
+                    "error": repr(e),
+                }
+            )
+
+
+class Detector:
+    """Matches a set of element templates against a single screen frame.
+
+    One call to `detect` grabs the screen once and runs every template
+    against that frame, instead of taking a screenshot per element.
+    When a location index is given, every element is searched around its
+    last seen location first and in the full frame only on a miss.
+
+    Results are cached together with a thumbnail of the frame: an element
+    found present stays there until its own region changes. An element
+    found absent stays absent until the region around its last seen
+    location changes; without a location, until an area of the frame
+    large enough to show it has mostly changed. So a video tile or a
+    clock changing elsewhere doesn't cause a new search.
+
+    With `pyramid_scale` the full frame search runs on a downscaled frame
+    with the downscaled templates, which must be preloaded in `templates`,
+    and only the best coarse candidates are matched at full resolution.
+    Coarser isn't faster: at 0.25 many templates are too small for the
+    coarse search and the candidates are less precise, the benchmark
+    measures 0.5 about 3.4x faster than full resolution and 0.25 slower
+    than 0.5.
+
+    With `max_scale_error` a coarse candidate which scores too low at full
+    resolution is refined with resized templates as well, up to that
+    relative size error. Template matching falls off quickly with scale,
+    a 500 pixel wide form is missed 1% off its size, so the templates are
+    resized in steps of about two pixels. Only the small candidate windows
+    are matched with them.
+    """
+
+    def __init__(
+        self,
+        grabber: XShmGrabber | ScreenshotGrabber,
+        templates: Templates,
+        locations: LocationIndex | None = None,
+        pyramid_scale: float | None = None,
+        max_scale_error: float = 0.0,
+    ):
+        self._grabber = grabber
+        self._templates = templates
+        self._locations = locations
+        self._pyramid_scale = pyramid_scale
+        self._max_scale_error = max_scale_error
+        # Resized templates per element, made when they are first needed
+        self._variants: dict[str, list[np.ndarray]] = {}
+        self._results: dict[str, tuple[np.ndarray, float, Match | None]] = {}
+        # The last frame and its downscaled copy
+        self._coarse: tuple[np.ndarray, np.ndarray] | None = None
+
+    def grab(self) -> np.ndarray:
+        # The only per-frame copy is the conversion to grayscale
+        with SCREENSHOT_SECONDS.time():
+            return self._grabber.grab_gray()
+
+    def close(self) -> None:
+        if self._locations is not None:
+            self._locations.flush()
+        self._grabber.close()
+
+    @staticmethod
+    def _match_in(
+        frame: np.ndarray,
+        template: np.ndarray,
+        name: str,
+        left: int = 0,
+        top: int = 0,
+    ) -> Match:
+        result = cv2.matchTemplate(frame, template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        height, width = template.shape[:2]
+        return Match(
+            name, left + max_loc[0], top + max_loc[1], width, height, float(max_val)
+        )
+
+    def _match_around(
+        self, frame: np.ndarray, template: np.ndarray, name: str, left: int, top: int, margin: int
+    ) -> Match | None:
+        """Matches the template in a window around the given location."""
+        height, width = template.shape[:2]
+        window_left = max(left - margin, 0)
+        window_top = max(top - margin, 0)
+        window = frame[
+            window_top : top + height + margin,
+            window_left : left + width + margin,
+        ]
+        if window.shape[0] < height or window.shape[1] < width:
+            return None
+        return self._match_in(window, template, name, window_left, window_top)
+
+    def _scale_variants(self, name: str, template: np.ndarray) -> list[np.ndarray]:
+        variants = self._variants.get(name)
+        if variants is None:
+            step = _VARIANT_STEP_PIXELS / max(template.shape[:2])
+            count = int(self._max_scale_error / step)
+            # Closest to the template size first
+            scales = [1 + sign * k * step for k in range(1, count + 1) for sign in (1, -1)]
+            variants = [
+                cv2.resize(
+                    template,
+                    None,
+                    fx=scale,
+                    fy=scale,
+                    interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR,
+                )
+                for scale in scales
+            ]
+            self._variants[name] = variants
+        return variants
+
+    def _downscaled(self, frame: np.ndarray) -> np.ndarray:
+        if self._coarse is None or self._coarse[0] is not frame:
+            coarse = cv2.resize(
+                frame,
+                None,
+                fx=self._pyramid_scale,
+                fy=self._pyramid_scale,
+                interpolation=cv2.INTER_AREA,
+            )
+            self._coarse = (frame, coarse)
+        return self._coarse[1]
+
+    def _match_pyramid(
+        self, frame: np.ndarray, template: np.ndarray, name: str, confidence: float
+    ) -> Match | None:
+        coarse_template = self._templates.get(name, self._pyramid_scale)
+        result = cv2.matchTemplate(
+            self._downscaled(frame), coarse_template, cv2.TM_CCOEFF_NORMED
+        )
+        coarse_height, coarse_width = coarse_template.shape[:2]
+        # A coarse pixel covers several full resolution ones
+        margin = int(round(2 / self._pyramid_scale)) + 1
+
+        best = None
+        for _ in range(_PYRAMID_CANDIDATES):
+            _, max_val, _, (x, y) = cv2.minMaxLoc(result)
+            if max_val < confidence - _PYRAMID_SLACK:
+                break
+            # Suppress the neighbourhood to get the next distinct candidate
+            result[
+                max(y - coarse_height // 2, 0) : y + coarse_height // 2 + 1,
+                max(x - coarse_width // 2, 0) : x + coarse_width // 2 + 1,
+            ] = -1
+
+            left = int(round(x / self._pyramid_scale))
+            top = int(round(y / self._pyramid_scale))
+            match = self._match_around(frame, template, name, left, top, margin)
+            if self._max_scale_error and (match is None or match.confidence < confidence):
+                for variant in self._scale_variants(name, template):
+                    rescaled = self._match_around(frame, variant, name, left, top, margin)
+                    if rescaled is not None and (
+                        match is None or rescaled.confidence > match.confidence
+                    ):
+                        match = rescaled
+                    if match is not None and match.confidence >= confidence:
+                        break
+            if match is not None and (best is None or match.confidence > best.confidence):
+                best = match
+        return best
+
+    def match(self, frame: np.ndarray, name: str, confidence: float) -> Match | None:
+        template = self._templates.get(name)
+        TEMPLATE_MATCHES.inc()
+
+        last_seen = self._locations.get(name) if self._locations else None
+        if last_seen is not None:
+            match = self._match_around(frame, template, name, *last_seen, _ROI_MARGIN)
+            if match is not None and match.confidence >= confidence:
+                self._locations.update(match)
+                return match
+
+        if self._pyramid_scale is not None and (
+            min(template.shape[:2]) * self._pyramid_scale >= _PYRAMID_MIN_SIZE
+        ):
+            match = self._match_pyramid(frame, template, name, confidence)
+        else:
+            match = self._match_in(frame, template, name)
+        if match is None or match.confidence < confidence:
+            return None
+        if self._locations is not None:
+            self._locations.update(match)
+        return match
+
+    @staticmethod
+    def _thumbnail(frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        return cv2.resize(
+            frame,
+            (max(width // _THUMBNAIL_SCALE, 1), max(height // _THUMBNAIL_SCALE, 1)),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    @staticmethod
+    def _unchanged(
+        before: np.ndarray, after: np.ndarray, box: tuple[int, int, int, int]
+    ) -> bool:
+        """Whether the (left, top, width, height) box of the frame is unchanged."""
+        if before.shape != after.shape:
+            return False
+        left, top, width, height = box
+        rows = slice(max(top, 0) // _THUMBNAIL_SCALE, -(-(top + height) // _THUMBNAIL_SCALE))
+        cols = slice(max(left, 0) // _THUMBNAIL_SCALE, -(-(left + width) // _THUMBNAIL_SCALE))
+        before = before[rows, cols]
+        after = after[rows, cols]
+        return int(cv2.absdiff(before, after).max(initial=0)) <= _CHANGE_THRESHOLD
+
+    @staticmethod
+    def _room_unchanged(before: np.ndarray, after: np.ndarray, template: np.ndarray) -> bool:
+        """Whether no area of the template's size has mostly changed."""
+        if before.shape != after.shape:
+            return False
+        changed = (cv2.absdiff(before, after) > _CHANGE_THRESHOLD).astype(np.float32)
+        height, width = template.shape[:2]
+        size = (max(width // _THUMBNAIL_SCALE, 1), max(height // _THUMBNAIL_SCALE, 1))
+        share = cv2.blur(changed, size, borderType=cv2.BORDER_CONSTANT)
+        return float(share.max(initial=0)) < _APPEARED_SHARE
+
+    def _miss_unchanged(self, name: str, before: np.ndarray, after: np.ndarray) -> bool:
+        template = self._templates.get(name)
+        last_seen = self._locations.get(name) if self._locations else None
+        if last_seen is None:
+            return self._room_unchanged(before, after, template)
+        # Elements show up where they were seen, as the index assumes
+        height, width = template.shape[:2]
+        left, top = last_seen
+        window = (
+            left - _ROI_MARGIN,
+            top - _ROI_MARGIN,
+            width + 2 * _ROI_MARGIN,
+            height + 2 * _ROI_MARGIN,
+        )
+        return self._unchanged(before, after, window)
+
+    def _cached(
+        self, name: str, confidence: float, thumbnail: np.ndarray
+    ) -> tuple[bool, Match | None]:
+        cached = self._results.get(name)
+        if cached is None:
+            return False, None
+        before, threshold, match = cached
+        if match is None:
+            # A miss at a stricter threshold says nothing about a looser one
+            if confidence >= threshold and self._miss_unchanged(name, before, thumbnail):
+                return True, None
+        elif match.confidence >= confidence and self._unchanged(
+            before, thumbnail, (match.left, match.top, match.width, match.height)
+        ):
+            return True, match
+        return False, None
+
+    def detect(
+        self,
+        names: Iterable[str],
+        confidence: float = 0.8,
+        frame: np.ndarray | None = None,
+    ) -> dict[str, Match]:
+        """Returns the elements found on the frame keyed by name."""
+        if frame is None:
+            frame = self.grab()
+        thumbnail = self._thumbnail(frame)
+
+        hits = {}
+        for name in names:
+            cached, match = self._cached(name, confidence, thumbnail)
+            if not cached:
+                match = self.match(frame, name, confidence)
+                self._results[name] = (thumbnail, confidence, match)
+            if match is not None:
+                hits[name] = match
+        _LOGGER.debug(
+            {
+                "message": "Detected elements",
+                "hits": {name: round(m.confidence, 3) for name, m in hits.items()},
+            }
+        )
+        return hits
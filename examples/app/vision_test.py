@@ -0,0 +1,131 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from examples.app.templates import NATIVE_GEOMETRY, Templates
+from examples.app.vision import Detector, LocationIndex, Match
+
+_SIZE = (720, 1280)
+
+
+class _CountingDetector(Detector):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.matched = []
+
+    def match(self, frame, name, confidence):
+        self.matched.append(name)
+        return super().match(frame, name, confidence)
+
+
+class DetectorCacheTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.banner = rng.integers(0, 256, (40, 120), dtype=np.uint8)
+        self.frame = np.full(_SIZE, 30, dtype=np.uint8)
+        self.templates = Templates("test", NATIVE_GEOMETRY, {"ok": {1.0: self.banner}})
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _detector(self, locations: dict | None = None) -> _CountingDetector:
+        index = None
+        if locations is not None:
+            index = LocationIndex(Path(self.tmp.name) / "locations.json", locations)
+        return _CountingDetector(None, self.templates, index)
+
+    def _changed(self, top: int, left: int, height: int, width: int) -> np.ndarray:
+        frame = self.frame.copy()
+        frame[top : top + height, left : left + width] = 200
+        return frame
+
+    def test_miss_is_kept_while_an_unrelated_region_changes(self):
+        detector = self._detector({"ok": (100, 100)})
+        self.assertEqual(detector.detect(["ok"], frame=self.frame), {})
+        # A video tile far from where the banner shows up
+        self.assertEqual(detector.detect(["ok"], frame=self._changed(400, 600, 240, 400)), {})
+        self.assertEqual(detector.matched, ["ok"])
+
+    def test_miss_is_dropped_when_its_region_changes(self):
+        detector = self._detector({"ok": (100, 100)})
+        detector.detect(["ok"], frame=self.frame)
+        frame = self.frame.copy()
+        frame[100:140, 100:220] = self.banner
+        self.assertIn("ok", detector.detect(["ok"], frame=frame))
+        self.assertEqual(detector.matched, ["ok", "ok"])
+
+    def test_unlocated_miss_is_kept_while_only_small_areas_change(self):
+        detector = self._detector()
+        detector.detect(["ok"], frame=self.frame)
+        # A clock is much smaller than the banner
+        detector.detect(["ok"], frame=self._changed(10, 10, 16, 48))
+        self.assertEqual(detector.matched, ["ok"])
+        detector.detect(["ok"], frame=self._changed(300, 300, 60, 160))
+        self.assertEqual(detector.matched, ["ok", "ok"])
+
+    def test_hit_is_kept_until_its_region_changes(self):
+        frame = self.frame.copy()
+        frame[200:240, 300:420] = self.banner
+        detector = self._detector()
+        hit = detector.detect(["ok"], frame=frame)["ok"]
+        self.assertEqual((hit.left, hit.top), (300, 200))
+        frame[500:600, 800:1000] = 200
+        self.assertEqual(detector.detect(["ok"], frame=frame)["ok"], hit)
+        self.assertEqual(detector.matched, ["ok"])
+
+
+class LocationIndexTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "pack" / "locations.json"
+
+    def test_changes_are_written_on_flush(self):
+        index = LocationIndex.load(self.path)
+        index.update(Match("view", 1100, 20, 61, 31, 0.95))
+        self.assertFalse(self.path.exists())
+        index.flush()
+        self.assertEqual(LocationIndex.load(self.path).get("view"), (1100, 20))
+
+    def test_broken_index_is_ignored(self):
+        self.path.parent.mkdir(parents=True)
+        for content in ("{", "[1, 2]", "3", '{"view": 1}', '{"view": [1]}'):
+            self.path.write_text(content)
+            with self.assertLogs("examples.app.vision", "WARNING"):
+                self.assertIsNone(LocationIndex.load(self.path).get("view"))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class DetectorScaleTest(unittest.TestCase):
+    def setUp(self):
+        # Form-like element: a box with some lines of "text"
+        self.form = np.full((160, 240), 230, dtype=np.uint8)
+        cv2.rectangle(self.form, (4, 4), (235, 155), 60, 2)
+        for row in range(5):
+            cv2.line(self.form, (20, 30 + row * 25), (120 + row * 20, 30 + row * 25), 40, 3)
+        cv2.rectangle(self.form, (150, 120), (220, 145), 90, -1)
+        self.templates = Templates(
+            "test",
+            NATIVE_GEOMETRY,
+            {"form": {1.0: self.form, 0.5: cv2.resize(self.form, None, fx=0.5, fy=0.5)}},
+        )
+        self.frame = np.full(_SIZE, 30, dtype=np.uint8)
+        scaled = cv2.resize(self.form, None, fx=1.02, fy=1.02)
+        height, width = scaled.shape
+        self.frame[200 : 200 + height, 300 : 300 + width] = scaled
+
+    def test_resized_element_is_found_by_its_scale_variants(self):
+        detector = Detector(None, self.templates, pyramid_scale=0.5, max_scale_error=0.02)
+        match = detector.match(self.frame, "form", 0.9)
+        self.assertIsNotNone(match)
+        self.assertLessEqual(abs(match.left - 300), 2)
+        self.assertLessEqual(abs(match.top - 200), 2)
+
+    def test_resized_element_is_missed_without_scale_variants(self):
+        detector = Detector(None, self.templates, pyramid_scale=0.5)
+        self.assertIsNone(detector.match(self.frame, "form", 0.9))
@@ -0,0 +1,177 @@
+import asyncio
+import contextlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator
+
+from examples.app.vision import Detector, Match
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ElementEvent:
+    name: str
+    # None when the element has disappeared
+    match: Match | None
+
+    @property
+    def appeared(self) -> bool:
+        return self.match is not None
+
+
+@dataclass
+class _Waiter:
+    names: frozenset[str]
+    check: Callable[[], Any]
+    future: asyncio.Future
+
+
+class ScreenWatcher:
+    """Background task which owns screen capture and runs the matchers.
+
+    Only the elements somebody is interested in are matched: the ones
+    subscribed with `watch` and the ones awaited with `wait_for` or
+    `wait_gone`. Without any of them the watcher doesn't touch the screen.
+
+    All the vision work runs on a single thread, `executor`, which the
+    callers should use for the blocking UI automation too, so screen
+    capture and clicks never race with each other.
+
+    The watcher serves the waits of coroutines, in ZoomApp the home screen
+    and the audio options after joining. The click sequences, which are
+    the join form, the chat and the maintenance fixes, run as one
+    blocking call on `executor`. They poll the detector between their own
+    clicks and can't await events there. While one of them runs, the
+    watcher waits for the thread, so there is still one capture at a time.
+    """
+
+    def __init__(self, detector: Detector, fps: float = 10.0, confidence: float = 0.8):
+        self.detector = detector
+        self.interval = 1 / fps
+        self.confidence = confidence
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vision")
+        # Currently visible elements among the watched ones
+        self.visible: dict[str, Match] = {}
+
+        self._subscriptions: list[tuple[frozenset[str], asyncio.Queue]] = []
+        self._waiters: list[_Waiter] = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        self.executor.shutdown(wait=False)
+
+    def _watched(self) -> frozenset[str]:
+        names = set()
+        for subscribed, _ in self._subscriptions:
+            names |= subscribed
+        for waiter in self._waiters:
+            names |= waiter.names
+        return frozenset(names)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            names = self._watched()
+            if not names:
+                self.visible.clear()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            started = loop.time()
+            try:
+                hits = await loop.run_in_executor(
+                    self.executor, self.detector.detect, names, self.confidence
+                )
+            except Exception as e:
+                _LOGGER.error({"message": "Failed to detect elements", "error": repr(e)})
+            else:
+                self._publish(names, hits)
+            await asyncio.sleep(max(self.interval - (loop.time() - started), 0))
+
+    def _publish(self, names: frozenset[str], hits: dict[str, Match]) -> None:
+        events = []
+        for name in names:
+            match = hits.get(name)
+            if (name in self.visible) != (match is not None):
+                events.append(ElementEvent(name, match))
+            if match is None:
+                self.visible.pop(name, None)
+            else:
+                self.visible[name] = match
+        for name in self.visible.keys() - names:
+            del self.visible[name]
+
+        for event in events:
+            _LOGGER.debug(
+                {
+                    "message": "Element appeared" if event.appeared else "Element disappeared",
+                    "element": event.name,
+                }
+            )
+            for subscribed, queue in self._subscriptions:
+                if event.name in subscribed:
+                    queue.put_nowait(event)
+
+        for waiter in self._waiters:
+            # The waiter is checked only on a frame which matched all its elements
+            if waiter.future.done() or not waiter.names <= names:
+                continue
+            result = waiter.check()
+            if result is not None:
+                waiter.future.set_result(result)
+
+    async def _wait(self, names: Iterable[str], check: Callable[[], Any], timeout: float | None):
+        waiter = _Waiter(frozenset(names), check, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._wakeup.set()
+        try:
+            return await asyncio.wait_for(waiter.future, timeout)
+        finally:
+            self._waiters.remove(waiter)
+
+    async def wait_for(self, *names: str, timeout: float | None = None) -> Match:
+        """Waits for any of the given elements, returns the best match."""
+
+        def check() -> Match | None:
+            matches = [self.visible[name] for name in names if name in self.visible]
+            return max(matches, key=lambda m: m.confidence, default=None)
+
+        try:
+            return await self._wait(names, check, timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Failed to find element {', '.join(names)}") from None
+
+    async def wait_gone(self, *names: str, timeout: float | None = None) -> None:
+        """Waits until none of the given elements is visible."""
+
+        def check() -> bool | None:
+            return True if all(name not in self.visible for name in names) else None
+
+        try:
+            await self._wait(names, check, timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Element is still shown {', '.join(names)}") from None
+
+    @contextlib.contextmanager
+    def watch(self, names: Iterable[str]) -> Iterator[asyncio.Queue]:
+        """Subscribes to appeared/disappeared events of the given elements."""
+        subscription = (frozenset(names), asyncio.Queue())
+        self._subscriptions.append(subscription)
+        self._wakeup.set()
+        try:
+            yield subscription[1]
+        finally:
+            self._subscriptions.remove(subscription)
@@ -0,0 +1,355 @@
+"""Keyboard and mouse input through the XTest extension.
+
+The methods mirror the part of pyautogui the app uses, without its pause
+after every call. The events of a call are queued and sent to the X
+server at once, typing a string costs one round trip.
+
+Text can also be pasted: the input owns the clipboard of the display
+with the text, presses ctrl+v and serves the request of the focused app.
+"""
+import contextlib
+import logging
+import time
+from typing import Callable, Iterator
+
+from Xlib import X, XK, Xatom
+from Xlib import display as xdisplay
+from Xlib.ext import xtest
+from Xlib.protocol import event as xevent
+
+_LOGGER = logging.getLogger(__name__)
+
+# pyautogui key names which differ from the X keysym names
+_KEY_NAMES = {
+    "alt": "Alt_L",
+    "backspace": "BackSpace",
+    "ctrl": "Control_L",
+    "delete": "Delete",
+    "down": "Down",
+    "end": "End",
+    "enter": "Return",
+    "esc": "Escape",
+    "home": "Home",
+    "left": "Left",
+    "return": "Return",
+    "right": "Right",
+    "shift": "Shift_L",
+    "space": "space",
+    "tab": "Tab",
+    "up": "Up",
+    "win": "Super_L",
+    # Keysyms of the function keys are upper case
+    **{f"f{n}": f"F{n}" for n in range(1, 13)},
+}
+_SPECIAL_CHARACTERS = {"\n": "Return", "\t": "Tab"}
+_SHIFT = "Shift_L"
+_LEFT_BUTTON = 1
+# Steps per second of a pointer movement with a duration
+_MOVE_RATE = 30
+# How long the focused app may take to ask for or hand over the clipboard
+_PASTE_TIMEOUT = 1.0
+_EVENT_POLL_INTERVAL = 0.005
+# Longer text would need the incremental selection transfer, it's typed
+_MAX_PASTE_BYTES = 64 * 1024
+
+
+def _char_keysym(char: str) -> int:
+    if char in _SPECIAL_CHARACTERS:
+        return XK.string_to_keysym(_SPECIAL_CHARACTERS[char])
+    code = ord(char)
+    # Latin-1 keysyms are the code points, the others are offset unicode
+    if 0x20 <= code <= 0x7E or 0xA0 <= code <= 0xFF:
+        return code
+    return 0x01000000 | code
+
+
+def _without_spaces(text: str) -> str:
+    return "".join(text.split())
+
+
+class XTestInput:
+    def __init__(self, display: str | None = None):
+        self._display = xdisplay.Display(display)
+        if not self._display.has_extension("XTEST"):
+            self._display.close()
+            raise RuntimeError(f"{display} doesn't support XTest")
+        screen = self._display.screen()
+        self._size = (screen.width_in_pixels, screen.height_in_pixels)
+        # Keycodes without keysyms, borrowed for characters the keyboard
+        # mapping doesn't have
+        info = self._display.display.info
+        first, count = info.min_keycode, info.max_keycode - info.min_keycode + 1
+        mapping = self._display.get_keyboard_mapping(first, count)
+        self._spare = [
+            first + offset for offset, keysyms in enumerate(mapping) if not any(keysyms)
+        ]
+        # Owns the clipboard while pasting and receives it when reading
+        self._window = screen.root.create_window(0, 0, 1, 1, 0, X.CopyFromParent)
+        self._atoms = {
+            name: self._display.intern_atom(name)
+            for name in (
+                "CLIPBOARD",
+                "TARGETS",
+                "UTF8_STRING",
+                "CALLBOT_CLIPBOARD",
+                "_NET_CLIENT_LIST",
+                "_NET_WM_STATE",
+                "_NET_WM_STATE_FULLSCREEN",
+            )
+        }
+        self._clipboard = b""
+        self._served = 0
+        self._received: bytes | None = None
+
+    def close(self) -> None:
+        self._window.destroy()
+        self._display.close()
+
+    def size(self) -> tuple[int, int]:
+        return self._size
+
+    def _keycode(self, name: str) -> int:
+        keysym = XK.string_to_keysym(_KEY_NAMES.get(name.lower(), name))
+        if keysym == X.NoSymbol:
+            # Single characters like "a" or "1" are pyautogui key names too
+            if len(name) == 1:
+                keysym = _char_keysym(name)
+            else:
+                raise ValueError(f"Unknown key {name}")
+        keycode = self._display.keysym_to_keycode(keysym)
+        if keycode == 0:
+            raise ValueError(f"No keycode for {name}")
+        return keycode
+
+    def _tap(self, keycode: int, shift: bool = False) -> None:
+        if shift:
+            xtest.fake_input(self._display, X.KeyPress, self._keycode(_SHIFT))
+        xtest.fake_input(self._display, X.KeyPress, keycode)
+        xtest.fake_input(self._display, X.KeyRelease, keycode)
+        if shift:
+            xtest.fake_input(self._display, X.KeyRelease, self._keycode(_SHIFT))
+
+    def press(self, *keys: str) -> None:
+        for key in keys:
+            self._tap(self._keycode(key))
+        self._display.sync()
+
+    def hotkey(self, *keys: str) -> None:
+        keycodes = [self._keycode(key) for key in keys]
+        for keycode in keycodes:
+            xtest.fake_input(self._display, X.KeyPress, keycode)
+        for keycode in reversed(keycodes):
+            xtest.fake_input(self._display, X.KeyRelease, keycode)
+        self._display.sync()
+
+    @contextlib.contextmanager
+    def hold(self, key: str) -> Iterator[None]:
+        keycode = self._keycode(key)
+        xtest.fake_input(self._display, X.KeyPress, keycode)
+        self._display.sync()
+        try:
+            yield
+        finally:
+            xtest.fake_input(self._display, X.KeyRelease, keycode)
+            self._display.sync()
+
+    def write(self, text: str, interval: float = 0.0) -> None:
+        """Types the text, in one batch unless `interval` is given."""
+        borrowed: dict[int, int] = {}
+        try:
+            for char in text:
+                keysym = _char_keysym(char)
+                position = next(iter(self._display.keysym_to_keycodes(keysym)), None)
+                if position is not None and position[1] in (0, 1):
+                    keycode, index = position
+                    self._tap(keycode, shift=index == 1)
+                elif keysym in borrowed:
+                    self._tap(borrowed[keysym])
+                else:
+                    self._tap(self._borrow(keysym, borrowed))
+                if interval:
+                    self._display.sync()
+                    time.sleep(interval)
+            self._display.sync()
+        finally:
+            if borrowed:
+                self._restore(borrowed)
+
+    def _borrow(self, keysym: int, borrowed: dict[int, int]) -> int:
+        if not self._spare:
+            raise RuntimeError("No spare keycodes to type with")
+        # The characters typed so far have to be handled with the mapping
+        # they were typed with
+        if len(borrowed) == len(self._spare):
+            self._display.sync()
+            self._restore(borrowed)
+        keycode = self._spare[len(borrowed)]
+        self._display.change_keyboard_mapping(keycode, [(keysym, keysym)])
+        self._display.sync()
+        borrowed[keysym] = keycode
+        return keycode
+
+    def _restore(self, borrowed: dict[int, int]) -> None:
+        for keycode in borrowed.values():
+            self._display.change_keyboard_mapping(keycode, [(X.NoSymbol, X.NoSymbol)])
+        self._display.sync()
+        borrowed.clear()
+
+    def _handle_events(self) -> None:
+        while self._display.pending_events():
+            event = self._display.next_event()
+            if event.type == X.SelectionRequest:
+                self._serve(event)
+            elif event.type == X.SelectionNotify and event.requestor == self._window:
+                self._receive(event)
+
+    def _serve(self, request) -> None:
+        utf8, targets = self._atoms["UTF8_STRING"], self._atoms["TARGETS"]
+        # Obsolete clients leave the property to the owner
+        prop = request.property if request.property != X.NONE else request.target
+        if request.target == targets:
+            request.requestor.change_property(
+                prop, Xatom.ATOM, 32, [targets, utf8, Xatom.STRING]
+            )
+        elif request.target in (utf8, Xatom.STRING):
+            request.requestor.change_property(prop, request.target, 8, self._clipboard)
+            self._served += 1
+        else:
+            prop = X.NONE
+        notify = xevent.SelectionNotify(
+            time=request.time,
+            requestor=request.requestor,
+            selection=request.selection,
+            target=request.target,
+            property=prop,
+        )
+        request.requestor.send_event(notify)
+        self._display.flush()
+
+    def _receive(self, notify) -> None:
+        if notify.property == X.NONE:
+            self._received = b""
+            return
+        reply = self._window.get_full_property(notify.property, X.AnyPropertyType)
+        value = reply.value if reply is not None else b""
+        self._received = value if isinstance(value, bytes) else value.encode("utf8")
+
+    def _wait_events(self, done: Callable[[], bool], timeout: float = _PASTE_TIMEOUT) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            self._handle_events()
+            if done():
+                return True
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(_EVENT_POLL_INTERVAL)
+
+    def paste(self, text: str) -> bool:
+        """Pastes the text, False when the focused app didn't take it."""
+        data = text.encode("utf8")
+        if len(data) > _MAX_PASTE_BYTES:
+            return False
+        clipboard = self._atoms["CLIPBOARD"]
+        self._clipboard = data
+        self._window.set_selection_owner(clipboard, X.CurrentTime)
+        if self._display.get_selection_owner(clipboard) != self._window:
+            return False
+
+        served = self._served
+        self.hotkey("ctrl", "v")
+        return self._wait_events(lambda: self._served > served)
+
+    def _copy_field(self) -> str | None:
+        """Copies the text of the focused field through the clipboard."""
+        clipboard = self._atoms["CLIPBOARD"]
+        self.hotkey("ctrl", "a")
+        self.hotkey("ctrl", "c")
+        if not self._wait_events(
+            lambda: self._display.get_selection_owner(clipboard) != self._window
+        ):
+            return None
+        self._received = None
+        self._window.convert_selection(
+            clipboard, self._atoms["UTF8_STRING"], self._atoms["CALLBOT_CLIPBOARD"], X.CurrentTime
+        )
+        self._display.flush()
+        if not self._wait_events(lambda: self._received is not None):
+            return None
+        # Leave the caret after the text
+        self.press("end")
+        return self._received.decode("utf8", "replace")
+
+    def enter_text(self, text: str, verify: bool = True) -> None:
+        """Pastes the text into the focused field, types it when that fails.
+
+        With `verify` the field is copied back after the paste and compared
+        ignoring whitespace, zoom groups the digits of meeting ids. Fields
+        which don't allow copying, like passwords, must not be verified.
+        """
+        if not text:
+            return
+        if self.paste(text):
+            if not verify:
+                return
+            entered = self._copy_field()
+            if entered is not None and _without_spaces(entered) == _without_spaces(text):
+                return
+            _LOGGER.warning({"message": "Paste is not verified, typing", "entered": entered})
+            self.hotkey("ctrl", "a")
+            self.press("backspace")
+        else:
+            _LOGGER.warning({"message": "Paste failed, typing", "length": len(text)})
+        self.write(text)
+
+    def is_fullscreen(self) -> bool:
+        """Whether a top level window is fullscreen, as the window manager has it."""
+        root = self._display.screen().root
+        clients = root.get_full_property(self._atoms["_NET_CLIENT_LIST"], Xatom.WINDOW)
+        for window_id in clients.value if clients is not None else ():
+            window = self._display.create_resource_object("window", window_id)
+            try:
+                state = window.get_full_property(self._atoms["_NET_WM_STATE"], Xatom.ATOM)
+            except Exception:
+                # The window is gone
+                continue
+            if state is not None and self._atoms["_NET_WM_STATE_FULLSCREEN"] in state.value:
+                return True
+        return False
+
+    def moveTo(self, x: float, y: float, duration: float = 0.0) -> None:
+        x, y = int(x), int(y)
+        steps = int(duration * _MOVE_RATE)
+        if steps > 1:
+            pointer = self._display.screen().root.query_pointer()
+            for step in range(1, steps):
+                xtest.fake_input(
+                    self._display,
+                    X.MotionNotify,
+                    x=pointer.root_x + (x - pointer.root_x) * step // steps,
+                    y=pointer.root_y + (y - pointer.root_y) * step // steps,
+                )
+                self._display.sync()
+                time.sleep(duration / steps)
+        xtest.fake_input(self._display, X.MotionNotify, x=x, y=y)
+        self._display.sync()
+
+    def click(self, x: float, y: float) -> None:
+        xtest.fake_input(self._display, X.MotionNotify, x=int(x), y=int(y))
+        xtest.fake_input(self._display, X.ButtonPress, _LEFT_BUTTON)
+        xtest.fake_input(self._display, X.ButtonRelease, _LEFT_BUTTON)
+        self._display.sync()
+
+
+def open_input(display: str | None, fallback: Callable):
+    """XTest input for the display, or what `fallback` returns without it."""
+    try:
+        return XTestInput(display)
+    except Exception as e:
+        _LOGGER.warning(
+            {
+                "message": "XTest is not available, falling back to pyautogui",
+                "display": display,
+                "error": repr(e),
+            }
+        )
+        return fallback()
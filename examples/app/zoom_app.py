@@ -1,13 +1,26 @@
 import asyncio
 import base64
+import contextlib
+import functools
+import os
 import textwrap
 import time
 import urllib.parse
 from pathlib import Path
+from typing import Callable, Iterable
 
 import logging
 from python.runfiles import runfiles  # pyright: ignore
 
+from examples.app.chat import Outbox
+from examples.app.drain import ProcessOutput, drain_async
+from examples.app.maintenance import Invariant, MaintenanceScheduler
+from examples.app.screen import open_grabber
+from examples.app.templates import NATIVE_GEOMETRY, Geometry, Templates
+from examples.app.vision import Detector, LocationIndex, Match
+from examples.app.watcher import ScreenWatcher
+from examples.app.xtest import XTestInput, open_input
+
 _LOGGER = logging.getLogger(__name__)
 
 _ZOOM_CONFIG = textwrap.dedent("""
@@ -66,6 +79,58 @@ _ZOOM_CONFIG = textwrap.dedent("""
             main_frame_pixel_pos_wide=
             """)
 
+# Banners which block the meeting view, in the order they are dismissed
+_BANNER_ELEMENTS = ("ok", "got_it", "i_agree")
+# Shown while joining: the audio options, the waiting room and the banners
+_AUDIO_OPTIONS_ELEMENTS = ("join_with_computer_audio", "wait_room") + _BANNER_ELEMENTS
+# Items of the view menu, they tell whether the menu is open
+_VIEW_MENU_ELEMENTS = ("gallery_view", "side_by_side_speaker")
+
+# How often the screen is polled while waiting for an element
+_POLL_INTERVAL = 0.1
+# How long a click may take to show its effect
+_CLICK_TIMEOUT = 5
+
+# Full frame searches run on a frame downscaled by this factor first, the
+# fastest scale in the benchmark
+_PYRAMID_SCALE = 0.5
+# Size error of the rendered elements which is still matched, the benchmark
+# shows that larger errors cost more time without finding more
+_MAX_SCALE_ERROR = 0.02
+# Last seen locations of the elements, one index per template pack
+_LOCATIONS_DIR = Path("/home/nonroot/tmp/locations")
+
+# Elements the app can't work without, checked when the templates are loaded
+_REQUIRED_ELEMENTS = (
+    "join_meeting",
+    "join_meeting_form",
+    "password_form",
+    "join",
+    "av_device_select_form",
+    "join_slim",
+    "view",
+    "gallery_layout",
+    "gallery_view",
+    "side_by_side_speaker",
+    "chat_icon",
+    "message_everyone",
+) + _AUDIO_OPTIONS_ELEMENTS
+
+
+@functools.lru_cache(maxsize=None)
+def load_templates(geometry: Geometry = NATIVE_GEOMETRY) -> Templates:
+    """Loads the element pack resized for the display, once per geometry."""
+    r = runfiles.Create()
+    elements_dir = Path(
+        r.Rlocation("_main/examples/app/new_zoom_elements/join_meeting.png")
+    ).parent
+    return Templates.load(
+        elements_dir,
+        required=_REQUIRED_ELEMENTS,
+        scales=(_PYRAMID_SCALE,),
+        geometry=geometry,
+    )
+
 
 class ZoomApp:
     def __init__(
@@ -76,9 +141,18 @@ class ZoomApp:
         password: str = "",
         screenshots_dir: Path = None,
         name: str = "AI-kit Meeting Bot",
+        templates: Templates | None = None,
+        fps: float = 10.0,
+        display: str | None = None,
+        home: Path = Path("/home/nonroot"),
+        output: ProcessOutput | None = None,
     ):
         self.proc = proc
+        # The last output of zoom, for the crash reports
+        self.output = output
         self.logger = logger
+        self.display = display
+        self.home = home
         self.email = email
         self.password = password
         self.name = name
@@ -89,14 +163,19 @@ class ZoomApp:
                 self.screenshots_dir = screenshots_dir / self.session_id
         
         self._view_changed = False
-        self._changed_to_fullscreen = False
         self._stop_video = False
         self._audio_muted = False
 
-        self.r = runfiles.Create()
+        self.templates = templates if templates is not None else load_templates()
         self._pyautogui = None
+        self._input = None
+        self._detector = None
+        self._fps = fps
+        self._watcher = None
         self._prepared = asyncio.Event()
         self._message_lock = asyncio.Lock() # Lock for sending all messages
+        self._outbox = Outbox()
+        self._sender = None
 
     @property
     def pyautogui(self):
@@ -106,6 +185,41 @@ class ZoomApp:
             self._pyautogui = pyautogui
         return self._pyautogui
 
+    @property
+    def input(self):
+        """Clicks and keys, pyautogui is only used when XTest is missing."""
+        if not self._input:
+            self._input = open_input(self.display, lambda: self.pyautogui)
+        return self._input
+
+    @property
+    def detector(self) -> Detector:
+        if not self._detector:
+            # pyautogui is imported only when the display doesn't support XShm
+            grabber = open_grabber(self.display, lambda: self.pyautogui.screenshot())
+            locations = LocationIndex.load(_LOCATIONS_DIR / f"{self.templates.name}.json")
+            self._detector = Detector(
+                grabber,
+                self.templates,
+                locations,
+                pyramid_scale=_PYRAMID_SCALE,
+                max_scale_error=_MAX_SCALE_ERROR,
+            )
+        return self._detector
+
+    @property
+    def watcher(self) -> ScreenWatcher:
+        # Must be accessed from the event loop, the watcher starts its task there
+        if not self._watcher:
+            self._watcher = ScreenWatcher(self.detector, fps=self._fps)
+            self._watcher.start()
+        return self._watcher
+
+    async def _run_vision(self, func, *args):
+        """Runs blocking UI automation on the thread which owns screen capture."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.watcher.executor, func, *args)
+
     @classmethod
     async def create(
         cls,
@@ -114,20 +228,41 @@ class ZoomApp:
         password: str = "",
         screenshots_dir: Path = None,
         name: str = "AI-kit Meeting Bot",
+        templates: Templates | None = None,
+        geometry: Geometry = NATIVE_GEOMETRY,
+        display: str | None = None,
+        home: Path = Path("/home/nonroot"),
+        audio_sink: str | None = None,
     ):
-        configs = Path("/home/nonroot/.config")
-        configs.mkdir(parents=True, exist_ok=True)
-        Path("/home/nonroot/.config/zoomus.conf").write_text(_ZOOM_CONFIG)
+        # Decode the element images before zoom is started to fail fast
+        if templates is None:
+            templates = load_templates(geometry)
 
+        configs = home / ".config"
+        configs.mkdir(parents=True, exist_ok=True)
+        (configs / "zoomus.conf").write_text(_ZOOM_CONFIG)
+
+        # Zoom keeps its state in HOME, every instance needs its own one
+        zoom_env = dict(os.environ, HOME=str(home))
+        if display is not None:
+            zoom_env["DISPLAY"] = display
+        if audio_sink is not None:
+            # libpulse clients use these instead of the server defaults
+            zoom_env["PULSE_SINK"] = audio_sink
+            zoom_env["PULSE_SOURCE"] = f"{audio_sink}.monitor"
         proc = await asyncio.subprocess.create_subprocess_exec(
-            "zoom", stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            "zoom",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=zoom_env,
         )
 
         logger.info(f"Zoom started at {proc.pid} (returncode = {proc.returncode})")
+        # Zoom is chatty, it would block on a full pipe in a long meeting
+        output = drain_async("zoom", proc)
 
         if proc.returncode is not None:
-            _, err = await proc.communicate()
-            raise RuntimeError(f"Zoom did not start ({proc.returncode}): zoom\n{err.decode('utf8')}")
+            raise RuntimeError(f"Zoom did not start ({proc.returncode}): zoom\n{output.text()}")
 
         return cls(
             proc,
@@ -136,13 +271,32 @@ class ZoomApp:
             password,
             screenshots_dir,
             name=name,
+            templates=templates,
+            display=display,
+            home=home,
+            output=output,
         )
 
     async def exit(self):
         assert self.proc is not None
-        if self.proc.returncode is not None:
+        if self._sender:
+            self._sender.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._sender
+            self._outbox.fail(RuntimeError("Zoom exited before the message was sent"))
+        if self._watcher:
+            await self._watcher.stop()
+        if self._detector:
+            self._detector.close()
+        if isinstance(self._input, XTestInput):
+            self._input.close()
+        if self.proc.returncode is None:
             self.proc.terminate()
 
+    async def wait_home_screen(self, timeout: float = 60) -> None:
+        """Waits until zoom shows the home screen and is ready to join."""
+        await self.watcher.wait_for("join_meeting", timeout=timeout)
+
     @staticmethod
     def extract_meeting_id_and_pwd(url):
         url_parsed = urllib.parse.urlparse(url)
@@ -152,249 +306,346 @@ class ZoomApp:
 
         return meeting_id, pwd
 
-    def _wait_for(self, element_image: Path, attempts: int = 30) -> None:
-        assert element_image.exists(), f"{element_image} doesn't exist"
-        # Wait for zoom is started
-        while attempts > 0:
-            try:
-                self.pyautogui.locateCenterOnScreen(str(element_image), confidence=0.8)
-            except Exception:
-                time.sleep(1)
-                attempts -= 1
-            else:
-                break
-        else:
-            raise RuntimeError(f"Failed to find element {element_image}")
-
-    def _get_image_by_name(self, name: str) -> Path:
-        return Path(
-            self.r.Rlocation(f"_main/examples/app/new_zoom_elements/{name}.png")
-        )
+    def _wait_until(
+        self,
+        condition: Callable[[dict[str, Match]], bool],
+        names: Iterable[str],
+        timeout: float,
+        confidence: float = 0.8,
+    ) -> dict[str, Match] | None:
+        """Polls the screen until the condition holds for the detected elements.
+
+        For the click sequences running on the vision thread, coroutines
+        wait through the watcher instead.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            hits = self.detector.detect(names, confidence=confidence)
+            if condition(hits):
+                return hits
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(_POLL_INTERVAL)
+
+    def _wait_for(self, *names: str, timeout: float = 30, confidence: float = 0.8) -> Match:
+        """Waits for any of the given elements, returns the best match."""
+        hits = self._wait_until(bool, names, timeout, confidence)
+        if not hits:
+            raise RuntimeError(f"Failed to find element {', '.join(names)}")
+        return max(hits.values(), key=lambda m: m.confidence)
+
+    def _click_on_match(
+        self,
+        match: Match,
+        appears: Iterable[str] = (),
+        disappears: Iterable[str] | None = None,
+        timeout: float = _CLICK_TIMEOUT,
+    ) -> None:
+        """Clicks on the element and waits for the expected result of the click.
+
+        The click is done when any of `appears` is shown or all of
+        `disappears` are gone. By default it waits for the clicked element
+        to disappear, pass empty `disappears` to not wait at all.
+        """
+        self.logger.info(f"Clicking on {match.name} ({match.confidence:.2f})")
+        x, y = match.center
+        self.input.click(x, y)
+
+        appears = tuple(appears)
+        disappears = (match.name,) if disappears is None else tuple(disappears)
+        if not appears and not disappears:
+            return
 
-    def _click_on_element(self, element_image: Path) -> None:
-        self.logger.info(f"Clicking on {element_image}")
-        x, y = self.pyautogui.locateCenterOnScreen(str(element_image), confidence=0.9)
-        try:
-            self.pyautogui.click(x, y)
-            time.sleep(5)
-        except TypeError as e:
-            raise RuntimeError(f"Failed to click on {element_image}") from e
-        
+        def clicked(hits: dict[str, Match]) -> bool:
+            return any(name in hits for name in appears) or bool(
+                disappears and all(name not in hits for name in disappears)
+            )
+
+        if self._wait_until(clicked, appears + disappears, timeout) is None:
+            self.logger.warning(
+                {
+                    "message": "Click had no expected effect",
+                    "element": match.name,
+                    "appears": appears,
+                    "disappears": disappears,
+                }
+            )
+
+    def _click_on_element(self, name: str, **kwargs) -> None:
+        hits = self.detector.detect((name,), confidence=0.9)
+        if name not in hits:
+            raise RuntimeError(f"Failed to click on {name}")
+        self._click_on_match(hits[name], **kwargs)
+
+    def _enter_text(self, text: str, verify: bool = True) -> None:
+        if isinstance(self.input, XTestInput):
+            self.input.enter_text(text, verify=verify)
+        else:
+            self.input.write(text)
 
     def _join(self) -> None:
-        join_meeting = self._get_image_by_name("join_meeting")
-        self._wait_for(join_meeting)
-        self._click_on_element(join_meeting)
+        join_meeting = self._wait_for("join_meeting")
+        self._click_on_match(join_meeting, appears=("join_meeting_form",))
 
         # Wait join a meeting form
-        join_meeting_form = self._get_image_by_name("join_meeting_form")
-        self._wait_for(join_meeting_form)
+        self._wait_for("join_meeting_form")
         # Fill join a meeting form
         # Insert meeting id
-        self.pyautogui.press("tab")
-        self.pyautogui.press("tab")
-        self.pyautogui.write(self.meeting_id, interval=0.1)
+        self.input.press("tab")
+        self.input.press("tab")
+        self._enter_text(self.meeting_id)
 
         # Insert name
-        self.pyautogui.press("tab")
-        self.pyautogui.hotkey("ctrl", "a")
-        self.pyautogui.write(self.name, interval=0.1)
+        self.input.press("tab")
+        self.input.hotkey("ctrl", "a")
+        self._enter_text(self.name)
 
         # Configure
-        self.pyautogui.press("tab")
-        self.pyautogui.press("space")
-        self.pyautogui.press("tab")
-        self.pyautogui.press("tab")
-        self.pyautogui.press("space")
-        self.pyautogui.press("tab")
+        self.input.press("tab")
+        self.input.press("space")
+        self.input.press("tab")
+        self.input.press("tab")
+        self.input.press("space")
+        self.input.press("tab")
         # Press join
-        self.pyautogui.press("tab")
-        self.pyautogui.press("space")
+        self.input.press("tab")
+        self.input.press("space")
 
         if self.pwd is not None:
             # Wait the password form
-            password_form = self._get_image_by_name("password_form")
-            self._wait_for(password_form)
-            self.pyautogui.write(self.pwd, interval=0.1)
+            self._wait_for("password_form")
+            # The password field doesn't allow copying it back
+            self._enter_text(self.pwd, verify=False)
 
-            join = self._get_image_by_name("join")
-            self._wait_for(join, attempts=5)
-            self._click_on_element(join)
+            join = self._wait_for("join", timeout=5)
+            self._click_on_match(join, appears=("i_agree", "av_device_select_form"))
 
-        # Accept the agreement
-        i_agree = self._get_image_by_name("i_agree")
+        # Accept the agreement or skip it if the devices form is already shown,
+        # both are checked on the same frame
         try:
-            self._wait_for(i_agree)
+            shown = self._wait_for("i_agree", "av_device_select_form")
         except RuntimeError:
-            # If the agreement is not shown, it means that the meeting is already started
             self.logger.info("No agreement form shown")
         else:
-            self._click_on_element(i_agree)
+            if shown.name == "i_agree":
+                self._click_on_match(shown, appears=("av_device_select_form",))
 
         # Wait for audio/video devices form
-        av_device_select_form = self._get_image_by_name("av_device_select_form")
-        self._wait_for(av_device_select_form)
+        self._wait_for("av_device_select_form")
 
-        join_slim = self._get_image_by_name("join_slim")
-        self._click_on_element(join_slim)
+        self._click_on_element("join_slim")
 
     async def join(self, meeting_url):
         self.meeting_id, self.pwd = self.extract_meeting_id_and_pwd(meeting_url)
-        loop = asyncio.get_running_loop()
-        _ = await loop.run_in_executor(None, self._join)
+        _ = await self._run_vision(self._join)
         return
 
     async def post_join(self):
-        loop = asyncio.get_running_loop()
-
-        # Wait for audio options form
-        join_with_computer_audio = self._get_image_by_name("join_with_computer_audio")
-        while True:
-            try:
-                _ = await loop.run_in_executor(None, self._wait_for, join_with_computer_audio)
-            except RuntimeError:
-                wait_to_join = self._get_image_by_name("wait_room")
-                try:
-                    _ = await loop.run_in_executor(None, self._wait_for, wait_to_join)
-                except RuntimeError:
-                    if not await loop.run_in_executor(None, self._check_banners):
-                        await asyncio.sleep(3)
-                        continue
-                else:
-                    await asyncio.sleep(3)
-                    continue
-            else:
-                break
-
-        _ = await loop.run_in_executor(None, self._click_on_element, join_with_computer_audio)
+        # Wait for audio options form, banners are dismissed meanwhile
+        # unless the bot is in the waiting room
+        with self.watcher.watch(("wait_room",)):
+            while True:
+                match = await self.watcher.wait_for(
+                    "join_with_computer_audio", *_BANNER_ELEMENTS
+                )
+                if match.name == "join_with_computer_audio":
+                    break
+                if "wait_room" in self.watcher.visible or not await self._run_vision(
+                    self._click_on_banner, {match.name: match}
+                ):
+                    await asyncio.sleep(self.watcher.interval)
+
+        _ = await self._run_vision(self._click_on_match, match)
 
         # Wait for the meeting to start
         await asyncio.sleep(5)
 
         self._prepared.set()
 
-        while True:
-            async with self._message_lock:
-                _ = await loop.run_in_executor(None, self._check_banners)
-                _ = await loop.run_in_executor(None, self._fullscreen)
-                _ = await loop.run_in_executor(None, self._click_at_side)
-                _ = await loop.run_in_executor(None, self._gallery_view)
-                _ = await loop.run_in_executor(None, self._click_at_side)
-                _ = await loop.run_in_executor(None, self._sbs_speaker_view)
-                _ = await loop.run_in_executor(None, self._click_at_side)
-            await asyncio.sleep(30)
+        # Messages are not interrupted by the maintenance clicks
+        scheduler = MaintenanceScheduler(self._invariants(), self._run_vision, self._message_lock)
+        await scheduler.run()
+
+    def _invariants(self) -> list[Invariant]:
+        def settled(fix: Callable[[], None]) -> Callable[[], None]:
+            # Closes the menus and hides the toolbars the fix has opened
+            def run() -> None:
+                fix()
+                self._click_at_side()
+
+            return run
+
+        return [
+            Invariant(
+                "no_banners",
+                check=lambda: not self.detector.detect(_BANNER_ELEMENTS, confidence=0.9),
+                fix=self._check_banners,
+                min_interval=2,
+                max_interval=60,
+                budget=5,
+            ),
+            Invariant(
+                "fullscreen",
+                check=self._is_fullscreen,
+                fix=settled(self._fullscreen),
+                min_interval=5,
+                max_interval=300,
+                budget=5,
+            ),
+            Invariant(
+                "gallery_view",
+                check=self._in_gallery_view,
+                fix=settled(self._gallery_view),
+                min_interval=30,
+                max_interval=600,
+                budget=10,
+            ),
+        ]
+
+    def _is_fullscreen(self) -> bool:
+        if isinstance(self.input, XTestInput):
+            return self.input.is_fullscreen()
+        # The view button is only shown in fullscreen
+        self._show_toolbars()
+        return "view" in self.detector.detect(("view",), confidence=0.9)
 
     def _fullscreen(self) -> None:
-        if self._changed_to_fullscreen:
+        if self._is_fullscreen():
             return
 
-        view = self._get_image_by_name("view")
-        try:
-            self._click_on_element(view)
-        except Exception:
-            # Seems zoom hasn't been in fullscreen yet
-            # so we can't find the view button
-            # Enter fullscreen
-            with self.pyautogui.hold("alt"):
-                self.pyautogui.press("f11")
-
-            self._changed_to_fullscreen = True
-            return
+        # Enter fullscreen
+        with self.input.hold("alt"):
+            self.input.press("f11")
+
+    def _in_gallery_view(self) -> bool:
+        # The view button shows the icon of the active layout, the toolbars
+        # hide in fullscreen so they are shown by moving the mouse first
+        self._show_toolbars()
+        hits = self.detector.detect(("view", "gallery_layout"), confidence=0.9)
+        view, icon = hits.get("view"), hits.get("gallery_layout")
+        if view is None:
+            # The layout can't be changed without the view button either
+            return True
+        return (
+            icon is not None
+            and view.left <= icon.left
+            and icon.left + icon.width <= view.left + view.width
+            and view.top <= icon.top
+            and icon.top + icon.height <= view.top + view.height
+        )
 
     def _gallery_view(self) -> None:
         # if self._view_changed:
         #     return
 
-        view = self._get_image_by_name("view")
         try:
-            self._click_on_element(view)
+            self._click_on_element("view", appears=_VIEW_MENU_ELEMENTS)
         except Exception:
             return
 
-        gallery_view = self._get_image_by_name("gallery_view")
         try:
-            self._wait_for(gallery_view, attempts=3)
-            self._click_on_element(gallery_view)
+            gallery_view = self._wait_for("gallery_view", timeout=3)
+            self._click_on_match(gallery_view)
             self._view_changed = True
         except Exception:
             # close view
             try:
-                self._click_on_element(view)
+                self._click_on_element("view", disappears=_VIEW_MENU_ELEMENTS)
             except Exception:
                 return
 
-    def _sbs_speaker_view(self) -> None:
-        view = self._get_image_by_name("view")
-        try:
-            self._click_on_element(view)
-        except Exception:
-            return
-
-        # In screen share mode the gallery view called side-by-side gallery
-        side_by_side_gallery_view = self._get_image_by_name("side_by_side_speaker")
-        try:
-            self._wait_for(side_by_side_gallery_view, attempts=3)
-            self._click_on_element(side_by_side_gallery_view)
-        except Exception:
-            # Click on the view again to hide it
-            # if the view is not changed
-            try:
-                self._click_on_element(view)
-            except Exception:
-                return
+    def _click_on_banner(self, hits: dict[str, Match]) -> bool:
+        # Banners are checked in the order of priority
+        for name in _BANNER_ELEMENTS:
+            match = hits.get(name)
+            if match is not None and match.confidence >= 0.9:
+                self._click_on_match(match)
+                return True
+        return False
 
     def _check_banners(self) -> bool:
-        ok = self._get_image_by_name("ok")
-        try:
-            self._click_on_element(ok)
-            return True
-        except Exception:
-            ...
-
-        got_it = self._get_image_by_name("got_it")
-        try:
-            self._click_on_element(got_it)
-            return True
-        except Exception:
-            ...
-
-        i_agree = self._get_image_by_name("i_agree")
-        try:
-            self._click_on_element(i_agree)
-            return True
-        except Exception:
-            ...
-
-        return False
+        hits = self.detector.detect(_BANNER_ELEMENTS, confidence=0.9)
+        return self._click_on_banner(hits)
 
     def _show_toolbars(self) -> None:
         # Mouse move to show toolbar
-        width, height = self.pyautogui.size()
+        width, height = self.input.size()
         y = height / 2
-        self.pyautogui.moveTo(0, y, duration=0.5)
-        self.pyautogui.moveTo(width - 1, y, duration=0.5)
+        self.input.moveTo(0, y, duration=0.5)
+        self.input.moveTo(width - 1, y, duration=0.5)
         
     def _click_at_side(self) -> None:
         # Click on the left side of the screen
-        width, height = self.pyautogui.size()
+        width, height = self.input.size()
         y = height / 2
         x = width / 2
-        self.pyautogui.click(x, y)
-
-    async def send_message(self, message: str) -> None:
-        async with self._message_lock:
-            self.logger.info("Sending welcome message")
-            chat_icon = self._get_image_by_name("chat_icon")
-            self._click_on_element(chat_icon)
-            self._wait_for(chat_icon, attempts=5)
-
-            insert_message_icon = self._get_image_by_name("message_everyone")
-            self._click_on_element(insert_message_icon)
-            self._wait_for(insert_message_icon, attempts=1)
-
-            self.pyautogui.write(message, interval=0.025)
-            self.pyautogui.press("enter")
-            self._click_on_element(chat_icon)
+        self.input.click(x, y)
+
+    def _open_chat(self) -> None:
+        self._click_on_element("chat_icon", appears=("message_everyone",))
+        self._wait_for("chat_icon", timeout=5)
+
+        # Focusing the input has no visible effect to wait for
+        self._click_on_element("message_everyone", disappears=())
+        self._wait_for("message_everyone", timeout=1)
+
+    def _post_message(self, message: str) -> None:
+        # The input keeps the focus after a message is posted
+        self._enter_text(message)
+        self.input.press("enter")
+
+    def _close_chat(self) -> None:
+        self._click_on_element("chat_icon", disappears=("message_everyone",))
+
+    async def _deliver(self) -> None:
+        """Posts the queued messages, opening the chat once per burst."""
+        while True:
+            await self._outbox.wait()
+            async with self._message_lock:
+                try:
+                    await self._run_vision(self._open_chat)
+                except Exception as e:
+                    self.logger.error(f"Failed to open the chat {repr(e)}")
+                    self._outbox.fail(e)
+                    continue
+
+                # Messages queued meanwhile are posted in the same session
+                while (item := self._outbox.pop()) is not None:
+                    self.logger.info(f"Sending message ({len(self._outbox)} more queued)")
+                    try:
+                        await self._run_vision(self._post_message, item.message)
+                    except asyncio.CancelledError:
+                        if not item.sent.done():
+                            item.sent.set_exception(
+                                RuntimeError("Zoom exited while the message was sent")
+                            )
+                        raise
+                    except Exception as e:
+                        if not item.sent.done():
+                            item.sent.set_exception(e)
+                    else:
+                        if not item.sent.done():
+                            item.sent.set_result(None)
+
+                try:
+                    await self._run_vision(self._close_chat)
+                except Exception as e:
+                    self.logger.warning(f"Failed to close the chat {repr(e)}")
+
+    async def send_message(
+        self, message: str, priority: int = 0, timeout: float | None = None
+    ) -> None:
+        """Queues the message and waits until it's posted.
+
+        Higher `priority` messages are posted first. RuntimeError is raised
+        when the message is still queued after `timeout` seconds or zoom
+        exits before it's posted.
+        """
+        if self._sender is None:
+            self._sender = asyncio.create_task(self._deliver())
+        elif self._sender.done():
+            raise RuntimeError("Zoom has exited")
+        await self._outbox.put(message, priority, timeout)
 
     async def send_welcome_message(self, message: str) -> None:
         await self._prepared.wait()